@@ -0,0 +1,242 @@
+"""
+asyncio front end for the social network project
+
+Mirrors the functions in main.py on top of pymongo's native asyncio
+client. One AsyncMongoClient owns the connection pool, so any number of
+concurrent coroutines share the same connections.
+"""
+
+import asyncio
+import time
+from contextlib import closing
+from operator import itemgetter
+
+import pymongo
+
+import ingest
+import main
+import validation
+
+DATABASE = "database"
+
+
+def get_mongo_client(connection_string="mongodb://localhost:27017/", **options):
+    """
+    Creates an asyncio MongoDB client instance
+    """
+    return pymongo.AsyncMongoClient(connection_string, **options)
+
+
+async def init_user_collection(mongo_client, database_name=DATABASE, table_name="UserAccounts"):
+    """
+    Returns the async collection for user data, ensuring its indexes.
+    """
+    collection = mongo_client[database_name][table_name]
+    if main.USER_INDEXES:
+        await collection.create_indexes(main.index_models(main.USER_INDEXES))
+    return collection
+
+
+async def init_status_collection(mongo_client, database_name=DATABASE,
+                                 table_name="StatusUpdates"):
+    """
+    Returns the async collection for status data, ensuring its indexes.
+    """
+    collection = mongo_client[database_name][table_name]
+    if main.STATUS_INDEXES:
+        await collection.create_indexes(main.index_models(main.STATUS_INDEXES))
+    return collection
+
+
+def _batches(filename, columns, batch_size, skip_incomplete=True):
+    """
+    Returns the ingest.load_batches generator for filename
+
+    Take batches off it with _next_batch and wrap it in contextlib.closing,
+    so the file is closed as soon as a load returns early.
+    """
+    stats = ingest.LoadStats()
+    stats.batch_size = batch_size
+    return ingest.load_batches(filename, columns, stats, skip_incomplete)
+
+
+async def _next_batch(batches):
+    """
+    Parses the next batch in a worker thread so other coroutines keep
+    running during a load; None once the file is exhausted
+    """
+    return await asyncio.to_thread(next, batches, None)
+
+
+async def load_users(filename, user_collection, batch_size=32):
+    """
+    Loads user accounts from a CSV file in batches.
+
+    As with main.load_users, the load stops and returns False at the first
+    batch that contains a user ID already in the collection, and files whose
+    columns are not in header order are detected and read correctly.
+    """
+    try:
+        layout = await asyncio.to_thread(validation.detect_layout, filename,
+                                         main.USER_COLUMNS)
+        reorder = itemgetter(*layout) if layout else None
+        with closing(_batches(filename, main.USER_COLUMNS, batch_size)) as batches:
+            while (rows := await _next_batch(batches)) is not None:
+                if reorder is not None:
+                    rows = [reorder(row) for row in rows]
+                user_ids = [row[0] for row in rows]
+                if len(set(user_ids)) != len(user_ids) or await user_collection.count_documents(
+                        {"_id": {"$in": user_ids}}, limit=1):
+                    return False
+                await user_collection.insert_many(main.documents(rows, main.USER_COLUMNS))
+        return True
+    except (FileNotFoundError, KeyError, pymongo.errors.BulkWriteError):
+        return False
+
+
+async def load_status_updates(filename, status_collection, batch_size=1000):
+    """
+    Streams status updates from a CSV file, one unordered insert_many per batch.
+
+    Duplicate status IDs are skipped as in UserStatusCollection.batch_load_statuses.
+    """
+    async def write_batch(batch):
+        try:
+            await status_collection.insert_many(batch, ordered=False)
+        except pymongo.errors.BulkWriteError as error:
+            for write_error in error.details['writeErrors']:
+                if write_error['code'] != 11000:  # If not a DuplicateKeyError
+                    print(f"Unexpected error in batch: {write_error}")
+                    return False
+        return True
+
+    try:
+        with closing(_batches(filename, main.STATUS_COLUMNS, batch_size,
+                              skip_incomplete=False)) as batches:
+            while (rows := await _next_batch(batches)) is not None:
+                if not await write_batch(main.documents(rows, main.STATUS_COLUMNS)):
+                    return False
+        return True
+    except (FileNotFoundError, KeyError):
+        return False
+
+
+async def add_user(user_id, email, user_name, user_last_name, user_collection):
+    """
+    Creates a new user in user_collection
+    """
+    user = {
+        "_id": user_id,
+        "user_email": email,
+        "user_name": user_name,
+        "user_last_name": user_last_name
+    }
+    try:
+        await user_collection.insert_one(user)
+        return True
+    except pymongo.errors.DuplicateKeyError:
+        return False
+
+
+async def update_user(user_id, email, user_name, user_last_name, user_collection):
+    """
+    Updates the values of an existing user
+    """
+    new_values = {"$set": {
+        "user_email": email,
+        "user_name": user_name,
+        "user_last_name": user_last_name
+    }}
+    result = await user_collection.update_one({"_id": user_id}, new_values)
+    return result.modified_count > 0
+
+
+async def delete_user(user_id, user_collection, status_collection):
+    """
+    Deletes a user from user_collection and associated statuses from status_collection.
+    """
+    user_result = await user_collection.delete_one({"_id": user_id})
+    if user_result.deleted_count > 0:
+        await status_collection.delete_many({"user_id": user_id})
+        return True
+    return False
+
+
+async def search_user(user_id, user_collection):
+    """
+    Searches for a user in user_collection
+    """
+    return await user_collection.find_one({"_id": user_id})
+
+
+async def add_status(user_id, status_id, status_text, status_collection, user_collection):
+    """
+    Creates a new status in status_collection if the user exists
+    """
+    if not await user_collection.find_one({"_id": user_id}, {"_id": 1}):
+        return False  # User does not exist, status cannot be added
+    status = {
+        "_id": status_id,
+        "user_id": user_id,
+        "status_text": status_text
+    }
+    try:
+        await status_collection.insert_one(status)
+        return True
+    except pymongo.errors.DuplicateKeyError:
+        return False
+
+
+async def update_status(status_id, user_id, status_text, status_collection):
+    """
+    Updates the text of an existing status owned by user_id
+    """
+    result = await status_collection.update_one({"_id": status_id, "user_id": user_id},
+                                                {"$set": {"status_text": status_text}})
+    return result.matched_count > 0
+
+
+async def delete_status(status_id, status_collection):
+    """
+    Deletes a status_id from status_collection.
+    """
+    result = await status_collection.delete_one({"_id": status_id})
+    return result.deleted_count > 0
+
+
+async def search_status(status_id, status_collection):
+    """
+    Searches for a status in status_collection; returns False if missing
+    """
+    result = await status_collection.find_one({"_id": status_id})
+    return result if result else False
+
+
+async def requests_per_second(concurrency, user_ids, user_collection):
+    """
+    Fires concurrency simultaneous search_user calls and returns requests/sec
+    """
+    start = time.perf_counter()
+    await asyncio.gather(*(search_user(user_ids[i % len(user_ids)], user_collection)
+                           for i in range(concurrency)))
+    return concurrency / (time.perf_counter() - start)
+
+
+async def _benchmark():
+    """
+    Reports search_user throughput for 100 to 1000 concurrent callers
+    """
+    client = get_mongo_client()
+    user_collection = await init_user_collection(client, table_name="AsyncBenchUsers")
+    user_ids = [f"bench_user_{i}" for i in range(100)]
+    for user_id in user_ids:
+        await add_user(user_id, "bench@uw.edu", "bench", "user", user_collection)
+    for concurrency in (100, 250, 500, 1000):
+        rate = await requests_per_second(concurrency, user_ids, user_collection)
+        print(f"{concurrency} concurrent callers: {rate:.0f} requests/sec")
+    await user_collection.drop()
+    await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_benchmark())
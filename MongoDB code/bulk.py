@@ -0,0 +1,99 @@
+"""
+Helpers shared by the bulk and row-reading methods of UserCollection and
+UserStatusCollection
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+
+import pymongo
+
+# Items per round trip in the bulk methods
+BATCH_SIZE = 1000
+
+
+def chunked(iterable, size=BATCH_SIZE):
+    """
+    Yields lists of at most size items from iterable
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def existing_ids(collection, ids):
+    """
+    Returns the subset of ids present in collection, using one $in query
+    """
+    return {doc["_id"] for doc in collection.find({"_id": {"$in": list(ids)}}, {"_id": 1})}
+
+
+def insert_unordered(collection, docs):
+    """
+    Inserts docs with an unordered insert_many and returns per-document success
+    """
+    results = [True] * len(docs)
+    if not docs:
+        return results
+    try:
+        collection.insert_many(docs, ordered=False)
+    except pymongo.errors.BulkWriteError as error:
+        for write_error in error.details["writeErrors"]:
+            results[write_error["index"]] = False
+    return results
+
+
+def find_many(collection, cache, kind, ids):
+    """
+    Looks ids up in cache, then fetches the rest with one $in query per chunk
+
+    Repeated ids are looked up once.
+    """
+    def load(keys):
+        found = {}
+        for chunk in chunked(keys):
+            for doc in collection.find({"_id": {"$in": chunk}}):
+                found[doc["_id"]] = doc
+        return found
+
+    if cache is None:
+        return load(list(dict.fromkeys(ids)))
+    return cache.get_or_load_many(kind, ids, load)
+
+
+@lru_cache(maxsize=None)
+def row_class(fields):
+    """
+    namedtuple class for rows of the given field names, built once per tuple
+    """
+    return namedtuple("Row", fields)
+
+
+def find_row(collection, key, fields, key_field):
+    """
+    Reads only the named fields of the document with _id key, as a namedtuple
+
+    key_field is the name the _id goes by in fields and in the row, since
+    namedtuple fields cannot start with an underscore. Fields missing from
+    the document are None. Returns False if no document matches.
+    """
+    fields = tuple(fields)
+    names = ["_id" if name == key_field else name for name in fields]
+    projection = dict.fromkeys(names, 1)
+    projection.setdefault("_id", 0)
+    doc = collection.find_one({"_id": key}, projection)
+    if doc is None:
+        return False
+    return row_class(fields)(*[doc.get(name) for name in names])
+
+
+def exists(collection, key):
+    """
+    Checks for a document with _id key; the query is covered by the _id index
+    """
+    return collection.find_one({"_id": key}, {"_id": 1}) is not None
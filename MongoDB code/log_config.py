@@ -0,0 +1,61 @@
+"""
+Logging set-up shared by the social network modules
+
+The log file sink is written by a background thread (enqueue=True) and
+gated by level, so CRUD calls below the configured level return before
+loguru does any formatting. Messages from the same call site are also
+rate limited so per-record lines cannot flood the log during big loads.
+The level defaults to the SOCIALNETWORK_LOG_LEVEL environment variable,
+or INFO when that is not set.
+"""
+
+import os
+import time
+
+from loguru import logger
+
+LOG_FILE = "log_file_{time:YYYY_MMM_DD}.log"
+
+
+class RateLimit:
+    """
+    loguru filter passing at most per_second records per call site
+
+    Records at WARNING or above are never dropped.
+    """
+
+    def __init__(self, per_second=10):
+        self.per_second = per_second
+        self.dropped = 0
+        self._windows = {}
+
+    def __call__(self, record):
+        if record["level"].no >= 30:
+            return True
+        site = (record["file"].path, record["line"])
+        second = int(time.monotonic())
+        window, count = self._windows.get(site, (second, 0))
+        if window != second:
+            window, count = second, 0
+        if count >= self.per_second:
+            self.dropped += 1
+            return False
+        self._windows[site] = (window, count + 1)
+        return True
+
+
+def configure_logging(level=None, sink=LOG_FILE, enqueue=True, per_second=10):
+    """
+    Replaces all loguru handlers with a single, level-gated sink
+
+    per_second=None disables rate limiting. Returns the handler id.
+    """
+    if level is None:
+        level = os.environ.get("SOCIALNETWORK_LOG_LEVEL", "INFO")
+    logger.remove()
+    return logger.add(
+        sink,
+        level=level,
+        enqueue=enqueue,
+        filter=RateLimit(per_second) if per_second else None,
+    )
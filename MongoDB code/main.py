@@ -1,98 +1,329 @@
 """
 Main driver for a simple social network project
+
+pymongo, loguru, the CSV loader and the modules built on them are
+imported on first use, so importing this module (and menu) stays cheap.
 """
 
-import csv
-import pymongo
+# pylint: disable=import-outside-toplevel
+
+from functools import partial
+
 # from loguru import logger
-import user_status
 
 DATABASE = "database"
+USER_COLUMNS = {
+    "USER_ID": "_id",  # Use USER_ID as the primary key
+    "EMAIL": "user_email",
+    "NAME": "user_name",
+    "LASTNAME": "user_last_name",
+}
+STATUS_COLUMNS = {
+    "STATUS_ID": "_id",
+    "USER_ID": "user_id",
+    "STATUS_TEXT": "status_text",
+}
+
+# Secondary indexes needed by the access paths, as (keys, options) pairs for
+# pymongo.IndexModel (1 ascending, -1 descending); _id is always indexed
+USER_INDEXES = []
+STATUS_INDEXES = [
+    # Serves get_user_statuses pages; its user_id prefix also serves the
+    # delete_many({"user_id": ...}) cascade in delete_user
+    ([("user_id", 1), ("_id", -1)], {"name": "user_id_timeline"}),
+    # Inverted index behind search_statuses_by_text; a collection can only
+    # have one text index
+    ([("status_text", "text")], {"name": "status_text"}),
+]
+
+
+# Named MongoClient settings. "bulk-ingest" trades durability for load
+# throughput; "serving" waits for a majority and fails fast on slow nodes.
+CLIENT_PROFILES = {
+    "default": {},
+    "bulk-ingest": {
+        "w": 1,
+        "journal": False,
+        "maxPoolSize": 200,
+        "compressors": "zlib",
+        "zlibCompressionLevel": 1,
+    },
+    "serving": {
+        "w": "majority",
+        "wTimeoutMS": 5000,
+        "maxPoolSize": 50,
+        "minPoolSize": 5,
+        "serverSelectionTimeoutMS": 3000,
+        "connectTimeoutMS": 2000,
+        "socketTimeoutMS": 5000,
+        "retryWrites": True,
+    },
+}
+
+
+def get_mongo_client(connection_string="mongodb://localhost:27017/", profile="default",
+                     client_class=None, **options):
+    """
+    Creates a MongoDB client instance using one of CLIENT_PROFILES
+
+    Extra keyword options override the profile. client_class defaults to
+    pymongo.MongoClient and lets tests pass a local stand-in such as
+    mongomock.MongoClient.
+    """
+    if client_class is None:
+        import pymongo
+        client_class = pymongo.MongoClient
+    settings = dict(CLIENT_PROFILES[profile])
+    settings.update(options)
+    return client_class(connection_string, **settings)
+
+
+def write_concern(profile):
+    """
+    Returns the WriteConcern described by a client profile
+    """
+    import pymongo
+    settings = CLIENT_PROFILES[profile]
+    return pymongo.WriteConcern(w=settings.get("w"), wtimeout=settings.get("wTimeoutMS"),
+                                j=settings.get("journal"))
+
+
+def with_profile(collection, profile):
+    """
+    Returns a copy of a UserCollection/UserStatusCollection that writes with
+    the write concern of profile; the connection pool is left unchanged.
+    """
+    if profile is None:
+        return collection
+    return type(collection)(
+        collection.database.with_options(write_concern=write_concern(profile)),
+        collection.cache)
 
 
-def get_mongo_client(connection_string="mongodb://localhost:27017/"):
+def index_models(indexes):
     """
-    Creates a MongoDB client instance
+    Turns (keys, options) index specs such as STATUS_INDEXES into IndexModels
     """
-    return pymongo.MongoClient(connection_string)
+    import pymongo
+    return [pymongo.IndexModel(keys, **options) for keys, options in indexes]
 
 
-def init_user_collection(mongo_client, database_name="database", table_name="UserAccounts"):
+def ensure_indexes(collection, indexes):
+    """
+    Creates the given indexes on a MongoDB collection.
+
+    Safe to call on every startup: indexes that already exist with the
+    same definition are left untouched by the server.
+    """
+    if indexes:
+        collection.create_indexes(index_models(indexes))
+
+
+def ensure_status_indexes(status_collection):
+    """
+    Builds the status indexes, e.g. once a bulk load has finished.
+    """
+    ensure_indexes(status_collection.database, STATUS_INDEXES)
+
+
+def init_user_collection(mongo_client, database_name="database", table_name="UserAccounts",
+                         build_indexes=True):
     """
     Creates and returns a MongoDB collection for user data.
     """
     db = mongo_client[database_name]  # Access the specified database by name
     collection = db[table_name]
+    if build_indexes:
+        ensure_indexes(collection, USER_INDEXES)
     return collection
 
 
-def init_status_collection(mongo_client, database_name="database", table_name="StatusUpdates"):
+def init_status_collection(mongo_client, database_name="database", table_name="StatusUpdates",
+                           cache=None, build_indexes=True):
     """
     Creates and returns a new instance of UserStatusCollection.
+
+    cache is an optional cache.LRUCache placed in front of search_status.
+    Pass build_indexes=False before a bulk load into an empty collection
+    and call ensure_status_indexes once the load is done.
     """
+    import user_status
     db = mongo_client[database_name]  # Access the specified database by name
-    status_collection = user_status.UserStatusCollection(db[table_name])
+    status_collection = user_status.UserStatusCollection(db[table_name], cache)
+    if build_indexes:
+        ensure_status_indexes(status_collection)
     return status_collection
 
 
-def load_users(filename, user_collection, batch_size=32):
+def init_write_behind(status_collection, user_collection, **options):
+    """
+    Returns a write_behind.WriteBehind queueing add_status calls for
+    status_collection
+
+    Each flush checks the users with one $in query on user_collection and
+    stores the batch with add_statuses, one insert_many per flush of up to
+    bulk.BATCH_SIZE rows; statuses of unknown users resolve to False.
+    options are passed on to WriteBehind.
+    """
+    import bulk
+    import write_behind
+
+    def write_batch(rows):
+        known = bulk.existing_ids(user_collection, {row[1] for row in rows})
+        added = iter(status_collection.add_statuses([row for row in rows if row[1] in known]))
+        return [row[1] in known and next(added) for row in rows]
+
+    return write_behind.WriteBehind(write_batch, **options)
+
+
+def raw_collection(collection):
+    """
+    The pymongo collection behind a UserCollection or UserStatusCollection,
+    or collection itself when it is not wrapped
+    """
+    import user_status
+    import users
+    if isinstance(collection, (users.UserCollection, user_status.UserStatusCollection)):
+        return collection.database
+    return collection
+
+
+def documents(rows, columns):
+    """
+    Turns ingest row tuples into documents keyed by the field names in columns
+
+    Documents are only built here, right before the insert, since BSON
+    encoding needs a mapping.
+    """
+    fields = list(columns.values())
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def load_users(filename, user_collection, batch_size=32, profile=None,
+               reject_file=None, stats=None):
     """
     Opens a CSV file with user data and adds it to an existing MongoDB collection
+
+    profile names a CLIENT_PROFILES entry whose write concern the load uses.
+    Files whose columns are not in header order are detected and read
+    correctly. With reject_file set, rows that fail validation are
+    quarantined there with their reasons instead of being skipped or
+    failing their batch; stats.rows counts the users written and
+    stats.rejected the ones quarantined.
     """
+    import pymongo
+    import bulk
+    import ingest
+    import validation
+    user_collection = with_profile(user_collection, profile)
+    if stats is None and reject_file is not None:
+        # The quarantine counts the rows it rejects in stats
+        stats = ingest.LoadStats()
+
+    def write_batch(batch):
+        try:
+            if not user_collection.batch_load_users(documents(batch, USER_COLUMNS)):
+                print('Mock duplicate key error')
+                return False
+        except (pymongo.errors.DuplicateKeyError, pymongo.errors.BulkWriteError):
+            print('Mock duplicate key error')
+            return False
+        return True
+
     try:
-        with open(filename, encoding="utf-8", newline="") as csvfile:
-            reader = csv.DictReader(csvfile)
-            user_data = []
-            for row in reader:
-                if all(key in row and row[key] for key in ["USER_ID", "EMAIL", "NAME", "LASTNAME"]):
-                    user_data.append({
-                        "_id": row["USER_ID"],  # Use USER_ID as the primary key
-                        "user_email": row["EMAIL"],
-                        "user_name": row["NAME"],
-                        "user_last_name": row["LASTNAME"]
-                    })
-
-            # Process data in batches
-            for i in range(0, len(user_data), batch_size):
-                batch = user_data[i:i + batch_size]
-                try:
-                    if not user_collection.batch_load_users(batch):
-                        print('Mock duplicate key error')
-                        return False
-                except pymongo.errors.DuplicateKeyError:
-                    print('Mock duplicate key error')
-                    return False
-
-            return True
+        layout = validation.detect_layout(filename, USER_COLUMNS)
+        with validation.quarantine(reject_file, USER_COLUMNS, stats,
+                                   id_exists=partial(bulk.existing_ids,
+                                                     user_collection.database)) as screen:
+            return ingest.stream_load(filename, USER_COLUMNS,
+                                      validation.screening(write_batch, screen, layout),
+                                      batch_size=batch_size,
+                                      skip_incomplete=reject_file is None, stats=stats)
     except (FileNotFoundError, KeyError) as e:
         print(f"Error loading users: {e}")
         return False
 
 
-def load_status_updates(filename, status_collection, batch_size=100):
+def load_status_updates(filename, status_collection, batch_size=100,
+                        max_memory_mb=None, stats=None, workers=1, profile=None,
+                        processes=None, reject_file=None, user_collection=None,
+                        checkpoint_file=None):
     """
-    Loads status updates from a CSV file into the database in batches.
+    Streams status updates from a CSV file into the database in batches.
+
+    Only one batch of rows is held in memory at a time. Pass an
+    ingest.LoadStats instance as stats to collect rows/sec and peak memory.
+    With workers > 1 the CSV is parsed while that many threads insert
+    batches concurrently; max_memory_mb only applies to the serial loader.
+    profile names a CLIENT_PROFILES entry whose write concern the load uses.
+    Set processes to parse the CSV in that many worker processes. With
+    reject_file set, rows that fail validation or repeat a status ID are
+    quarantined there instead of failing their batch. Pass the user
+    collection, as returned by init_user_collection or wrapped in a
+    UserCollection, as user_collection to check that every status belongs
+    to a known user: unknown users are quarantined with reject_file set and
+    otherwise fail the load, keeping the batches stored before theirs.
+
+    With checkpoint_file set the load records its progress in that file
+    every ingest.CHECKPOINT_ROWS rows; calling it again after a failure
+    resumes from the last checkpoint. Statuses of the first chunk replayed
+    that were already stored are skipped before validation. Checkpointed
+    loads cannot use workers or processes.
     """
+    if checkpoint_file is not None and (workers > 1 or processes):
+        raise ValueError("checkpointed loads cannot use workers or processes")
+    import bulk
+    import ingest
+    import validation
+    status_collection = with_profile(status_collection, profile)
+    if stats is None and reject_file is not None:
+        stats = ingest.LoadStats()
+
+    user_exists = None
+    if user_collection is not None:
+        user_exists = partial(bulk.existing_ids, raw_collection(user_collection))
+
+    def write_batch(batch):
+        if user_exists is not None and reject_file is None:
+            user_ids = {row[1] for row in batch}
+            unknown = user_ids - user_exists(user_ids)
+            if unknown:
+                print(f"Error loading batch of statuses ending at status ID {batch[-1][0]}: "
+                      f"unknown user {min(unknown)}")
+                return False
+        if not status_collection.batch_load_statuses(documents(batch, STATUS_COLUMNS)):
+            print(f"Error loading batch of statuses ending at status ID {batch[-1][0]}")
+            return False
+        return True
     try:
-        with open(filename, 'r', encoding="utf-8", newline="") as file:
-            reader = csv.DictReader(file)
-            status_updates = []
-
-            for row in reader:
-                status_updates.append({
-                    "_id": row['STATUS_ID'],
-                    "user_id": row['USER_ID'],
-                    "status_text": row['STATUS_TEXT']
-                })
-
-            # Process data in batches
-            for i in range(0, len(status_updates), batch_size):
-                batch = status_updates[i:i + batch_size]
-                if not status_collection.batch_load_statuses(batch):
-                    print(f"Error loading batch of statuses starting at index {i}")
-                    return False
-
-            return True
+        checkpoint = None
+        if checkpoint_file is not None:
+            checkpoint = ingest.Checkpoint(filename, checkpoint_file)
+        with validation.quarantine(reject_file, STATUS_COLUMNS, stats,
+                                   id_exists=partial(bulk.existing_ids,
+                                                     status_collection.database),
+                                   user_exists=user_exists,
+                                   append=checkpoint is not None
+                                   and checkpoint.replaying) as screen:
+            write = validation.screening(write_batch, screen)
+            if checkpoint is not None:
+                write = ingest.skip_replayed(
+                    write, checkpoint,
+                    partial(bulk.existing_ids, status_collection.database))
+                return ingest.resumable_load(filename, STATUS_COLUMNS, write, checkpoint,
+                                             batch_size=batch_size,
+                                             max_memory_mb=max_memory_mb,
+                                             skip_incomplete=False, stats=stats)
+            if workers > 1:
+                return ingest.parallel_load(filename, STATUS_COLUMNS, write,
+                                            workers=workers, batch_size=batch_size,
+                                            skip_incomplete=False, stats=stats,
+                                            processes=processes)
+            return ingest.stream_load(filename, STATUS_COLUMNS, write,
+                                      batch_size=batch_size,
+                                      max_memory_mb=max_memory_mb,
+                                      skip_incomplete=False, stats=stats,
+                                      processes=processes)
     except FileNotFoundError:
         # logger.debug("File %s was not found", filename)
         return False
@@ -102,6 +333,7 @@ def add_user(user_id, email, user_name, user_last_name, user_collection):
     """
     Creates a new instance of Users and stores it in user_collection
     """
+    import pymongo
     user = {
         "_id": user_id,
         "user_email": email,
@@ -153,13 +385,24 @@ def search_user(user_id, user_collection):
     return user_collection.find_one({"_id": user_id})
 
 
+def search_users(user_ids, user_collection):
+    """
+    Searches for many users at once, such as the authors of a page of
+    statuses, with one $in query per chunk of IDs; returns a dict of the
+    users found keyed by user ID
+    """
+    import bulk
+    return bulk.find_many(user_collection, None, "user", user_ids)
+
+
 def add_status(user_id, status_id, status_text, status_collection, user_collection):
     """
     Creates a new instance of UserStatus and stores it in status_collection
     """
-    user_exists = user_collection.find_one({"_id": user_id})
+    import bulk
 
-    if not user_exists:
+    # Only the _id is read back, so the whole user document is not fetched
+    if not bulk.exists(user_collection, user_id):
         return False  # User does not exist, status cannot be added
 
     return status_collection.add_status(status_id, user_id, status_text)
@@ -184,3 +427,26 @@ def search_status(status_id, status_collection):
     Searches for a status in status_collection
     """
     return status_collection.search_status(status_id)
+
+
+def search_statuses(status_ids, status_collection):
+    """
+    Searches for many statuses at once; returns a dict of the statuses
+    found keyed by status ID
+    """
+    return status_collection.search_statuses(status_ids)
+
+
+def get_user_statuses(user_id, status_collection, after=None, limit=25):
+    """
+    Yields a page of a user's statuses, latest first; see
+    UserStatusCollection.get_user_statuses for the cursor semantics
+    """
+    return status_collection.get_user_statuses(user_id, after, limit)
+
+
+def search_statuses_by_text(query, status_collection, limit=25):
+    """
+    Full-text search over status texts, best matches first
+    """
+    return status_collection.search_statuses_by_text(query, limit)
@@ -0,0 +1,75 @@
+"""
+Tests for the client profiles in main, run against mongomock
+"""
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import cache  # pylint: disable=wrong-import-position
+import main  # pylint: disable=wrong-import-position
+import user_status  # pylint: disable=wrong-import-position
+
+
+class RecordingClient(mongomock.MongoClient):
+    """
+    mongomock client remembering the settings it was created with
+    """
+
+    def __init__(self, host=None, **settings):
+        self.connection_string = host
+        self.settings = settings
+        super().__init__(host, **settings)
+
+
+@pytest.mark.parametrize("profile", sorted(main.CLIENT_PROFILES))
+def test_get_mongo_client_applies_profile(profile):
+    client = main.get_mongo_client(profile=profile, client_class=RecordingClient)
+    assert client.connection_string == "mongodb://localhost:27017/"
+    assert client.settings == main.CLIENT_PROFILES[profile]
+
+
+def test_get_mongo_client_options_override_profile():
+    client = main.get_mongo_client(
+        "mongodb://db:27017/", profile="serving", client_class=RecordingClient,
+        maxPoolSize=7)
+    assert client.connection_string == "mongodb://db:27017/"
+    assert client.settings["maxPoolSize"] == 7
+    assert client.settings["w"] == "majority"
+    assert main.CLIENT_PROFILES["serving"]["maxPoolSize"] == 50
+
+
+def test_get_mongo_client_unknown_profile():
+    with pytest.raises(KeyError):
+        main.get_mongo_client(profile="nightly", client_class=mongomock.MongoClient)
+
+
+def test_get_mongo_client_returns_working_client():
+    client = main.get_mongo_client(profile="bulk-ingest", client_class=mongomock.MongoClient)
+    statuses = main.init_status_collection(client, "test")
+    assert statuses.add_status("s1", "u1", "hello")
+    assert statuses.search_status("s1")["status_text"] == "hello"
+
+
+def test_write_concern():
+    assert main.write_concern("default").document == {}
+    assert main.write_concern("bulk-ingest").document == {"w": 1, "j": False}
+    assert main.write_concern("serving").document == {"w": "majority", "wtimeout": 5000}
+
+
+def test_with_profile_without_profile_returns_collection():
+    statuses = main.init_status_collection(mongomock.MongoClient(), "test")
+    assert main.with_profile(statuses, None) is statuses
+
+
+def test_with_profile_sets_write_concern():
+    client = mongomock.MongoClient()
+    statuses = main.init_status_collection(client, "test", cache=cache.LRUCache(10))
+    profiled = main.with_profile(statuses, "bulk-ingest")
+    assert isinstance(profiled, user_status.UserStatusCollection)
+    assert profiled.cache is statuses.cache
+    assert profiled.database.write_concern.document == {"w": 1, "j": False}
+    assert statuses.database.write_concern.document == {}
+    # Both copies write to the same collection
+    assert profiled.add_status("s1", "u1", "hello")
+    assert statuses.search_status("s1")["user_id"] == "u1"
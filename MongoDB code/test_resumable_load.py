@@ -0,0 +1,77 @@
+"""
+Tests for resuming a checkpointed status load after a crash, run against
+mongomock
+"""
+
+import csv
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import ingest  # pylint: disable=wrong-import-position
+import main  # pylint: disable=wrong-import-position
+
+USERS = 20
+# Checkpoint interval used by the tests, which keeps the status file small
+CHUNK_ROWS = 1000
+STATUSES = 5 * CHUNK_ROWS
+
+
+class Crash(Exception):
+    """
+    Stands in for the process being killed
+    """
+
+
+@pytest.fixture(name="files")
+def fixture_files(tmp_path):
+    client = mongomock.MongoClient()
+    user_collection = main.init_user_collection(client, "test")
+    status_collection = main.init_status_collection(client, "test")
+    user_collection.insert_many([{"_id": f"user{i}", "user_email": f"user{i}@uw.edu",
+                                  "user_name": "User", "user_last_name": f"Name{i}"}
+                                 for i in range(USERS)])
+    status_updates = tmp_path / "status_updates.csv"
+    with open(status_updates, "w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(main.STATUS_COLUMNS)
+        for i in range(STATUSES):
+            writer.writerow([f"user{i % USERS}_{i:07d}", f"user{i % USERS}", f"status {i}"])
+    return (user_collection, status_collection, str(status_updates),
+            str(tmp_path / "rejects.csv"))
+
+
+def test_resume_with_reject_file_rejects_nothing(files, monkeypatch):
+    user_collection, status_collection, status_updates, reject_file = files
+    checkpoint_file = status_updates + ".checkpoint"
+    save = ingest.Checkpoint.save
+    saves = []
+
+    def crash_on_second_save(checkpoint, offset, rows):
+        # The second chunk is stored but its checkpoint is never written,
+        # so the resumed load replays a chunk that is already stored
+        saves.append(offset)
+        if len(saves) == 2:
+            raise Crash
+        save(checkpoint, offset, rows)
+
+    monkeypatch.setattr(ingest, "CHECKPOINT_ROWS", CHUNK_ROWS)
+    monkeypatch.setattr(ingest.Checkpoint, "save", crash_on_second_save)
+    with pytest.raises(Crash):
+        main.load_status_updates(status_updates, status_collection, reject_file=reject_file,
+                                 user_collection=user_collection,
+                                 checkpoint_file=checkpoint_file)
+    monkeypatch.setattr(ingest.Checkpoint, "save", save)
+    assert status_collection.database.count_documents({}) > CHUNK_ROWS
+
+    stats = ingest.LoadStats()
+    assert main.load_status_updates(status_updates, status_collection,
+                                    reject_file=reject_file,
+                                    user_collection=user_collection,
+                                    checkpoint_file=checkpoint_file, stats=stats)
+    assert stats.rejected == 0
+    assert not stats.reasons
+    with open(reject_file, encoding="utf-8", newline="") as csv_file:
+        assert list(csv.reader(csv_file)) == [list(main.STATUS_COLUMNS) + ["REASONS"]]
+    assert status_collection.database.count_documents({}) == STATUSES
@@ -2,6 +2,10 @@
 classes to manage the user status messages
 """
 import pymongo
+import bulk
+
+# Default fields of the rows read by search_status_row
+STATUS_ROW = ("status_id", "user_id", "status_text")
 
 
 # from loguru import logger
@@ -17,22 +21,32 @@ class UserStatusCollection:
     Collection of UserStatus messages
     """
 
-    def __init__(self, database):
+    def __init__(self, database, cache=None):
         self.database = database
+        self.cache = cache
         # logger.debug("Status database successfully linked")
 
+    def _invalidate(self, status_id):
+        """
+        Drops a status from the cache
+        """
+        if self.cache is not None:
+            self.cache.invalidate(("status", status_id))
+
     def add_status(self, status_id, user_id, status_text):
         """
         Adds a new status to the collection
         """
-        if self.search_status(status_id):
-            return False
         status = {
             "_id": status_id,
             "user_id": user_id,
             "status_text": status_text
         }
-        self.database.insert_one(status)
+        try:
+            self.database.insert_one(status)
+        except pymongo.errors.DuplicateKeyError:
+            return False
+        self._invalidate(status_id)
         return True
 
     def batch_load_statuses(self, data):
@@ -57,52 +71,180 @@ class UserStatusCollection:
         The new user_id and status_text are assigned to the existing message
         only if the provided user_id matches the user_id associated with the status_id.
         """
-        # Search for the existing status
-        existing_status = self.search_status(status_id)
-
-        if not existing_status:
-            # Rejects a status that does not exist
-            # logger.debug("Status ID %s does not exist in the database", status_id)
-            return False
-
-        if existing_status.get("user_id") != user_id:
-            # Rejects if user_id does not match
-            # logger.debug("User ID %s does not match the status ID %s", user_id, status_id)
-            return False
-
-        # Proceed with updating the status
+        # Matching on both ids rejects a missing status and a user_id mismatch
         data = {"status_text": status_text}
-        self.database.update_one({"_id": status_id}, {"$set": data})
-        # logger.debug("Status ID %s successfully updated in the database", status_id)
+        result = self.database.update_one({"_id": status_id, "user_id": user_id},
+                                          {"$set": data})
+        if not result.matched_count:
+            # logger.debug("Status ID {} does not exist for user ID {}", status_id, user_id)
+            return False
+        self._invalidate(status_id)
+        # logger.debug("Status ID {} successfully updated in the database", status_id)
         return True
 
     def delete_status(self, status_id):
         """
         Deletes the status message with id, status_id
         """
-        if not self.search_status(status_id):
-            # logger.debug("Status ID %s does not exist in the database", status_id)
+        if not self.database.delete_one({"_id": status_id}).deleted_count:
+            # logger.debug("Status ID {} does not exist in the database", status_id)
             return False
-        self.database.delete_one({"_id": status_id})
-        # logger.debug("Status ID %s successfully deleted from the database", status_id)
+        self._invalidate(status_id)
+        # logger.debug("Status ID {} successfully deleted from the database", status_id)
         return True
 
     def delete_many(self, query):
         """
         Deletes multiple statuses from the collection based on the query.
+
+        Cached statuses matching an equality-only query are evicted; any
+        other query clears every cached status.
+        """
+        result = self.database.delete_many(query)
+        if self.cache is not None:
+            if any(isinstance(value, dict) for value in query.values()):
+                self.cache.invalidate_where(lambda key, _: key[0] == "status")
+            else:
+                self.cache.invalidate_where(
+                    lambda key, doc: key[0] == "status"
+                    and all(doc.get(field) == value for field, value in query.items())
+                )
+        return result
+
+    def add_statuses(self, statuses):
+        """
+        Adds many statuses with one unordered insert_many per chunk
+
+        statuses is an iterable of (status_id, user_id, status_text) tuples.
+        Returns a list of booleans in input order; an item is False when its
+        status ID already exists or repeats an earlier item.
+        """
+        results = []
+        for chunk in bulk.chunked(statuses):
+            docs = [{"_id": status_id, "user_id": user_id, "status_text": status_text}
+                    for status_id, user_id, status_text in chunk]
+            results.extend(bulk.insert_unordered(self.database, docs))
+            for doc in docs:
+                self._invalidate(doc["_id"])
+        return results
+
+    def modify_statuses(self, statuses):
+        """
+        Modifies many statuses with one $in lookup and one bulk_write per chunk
+
+        statuses is an iterable of (status_id, user_id, status_text) tuples.
+        As with modify_status, an item is False unless the status exists and
+        belongs to the given user_id.
+        """
+        results = []
+        for chunk in bulk.chunked(statuses):
+            owners = {doc["_id"]: doc.get("user_id") for doc in self.database.find(
+                {"_id": {"$in": [row[0] for row in chunk]}}, {"user_id": 1})}
+            requests = []
+            for status_id, user_id, status_text in chunk:
+                matched = status_id in owners and owners[status_id] == user_id
+                results.append(matched)
+                if matched:
+                    requests.append(pymongo.UpdateOne(
+                        {"_id": status_id, "user_id": user_id},
+                        {"$set": {"status_text": status_text}}))
+                self._invalidate(status_id)
+            if requests:
+                self.database.bulk_write(requests, ordered=False)
+        return results
+
+    def delete_statuses(self, status_ids):
         """
-        return self.database.delete_many(query)
+        Deletes many statuses with one $in lookup and one delete_many per chunk
+
+        Returns a list of booleans in input order; an item is False when the
+        status ID does not exist or was already deleted earlier in the call.
+        """
+        results = []
+        for chunk in bulk.chunked(status_ids):
+            found = bulk.existing_ids(self.database, chunk)
+            if found:
+                self.database.delete_many({"_id": {"$in": list(found)}})
+            for status_id in chunk:
+                results.append(status_id in found)
+                found.discard(status_id)
+                self._invalidate(status_id)
+        return results
+
+    def search_statuses(self, status_ids):
+        '''
+        Searches for many statuses with one $in query per chunk
+
+        Returns a dict mapping each status ID that was found to its document;
+        IDs that do not exist are left out.
+        '''
+        return bulk.find_many(self.database, self.cache, "status", status_ids)
+
+    def get_user_statuses(self, user_id, after=None, limit=25):
+        """
+        Yields up to limit statuses of user_id, latest first
+
+        Statuses are ordered by descending _id, the only ordering the data
+        carries. Pass the _id of the last status of a page as after to fetch
+        the next page; the (user_id, _id) index turns every page into an
+        index range scan instead of a skip.
+        """
+        query = {"user_id": user_id}
+        if after is not None:
+            query["_id"] = {"$lt": after}
+        yield from self.database.find(query).sort("_id", pymongo.DESCENDING).limit(limit)
+
+    def search_statuses_by_text(self, query, limit=25):
+        """
+        Returns up to limit statuses matching any word of query, best first
+
+        Uses the status_text text index, so words are stemmed and ranked by
+        textScore; phrase quotes and -negation in query are treated as plain
+        text.
+        """
+        terms = " ".join(query.replace('"', " ").replace("-", " ").split())
+        if not terms:
+            return []
+        score = {"score": {"$meta": "textScore"}}
+        return list(self.database.find({"$text": {"$search": terms}}, score)
+                    .sort([("score", {"$meta": "textScore"})]).limit(limit))
 
     def search_status(self, status_id):
         '''
         Find and return a status message by its status_id
 
-        Returns an empty UserStatus object if status_id does not exist
+        Returns an empty UserStatus object if status_id does not exist.
+        Served from the cache when one was given to the collection.
+        '''
+        if self.cache is None:
+            return self._search_status(status_id)
+        return self.cache.get_or_load(
+            ("status", status_id), self._search_status, status_id
+        )
+
+    def _search_status(self, status_id):
+        '''
+        Reads a status message from the database
         '''
         query = {"_id": status_id}
         result = self.database.find_one(query)
         if not result:
-            # logger.debug("Status ID %s was not found in the database", status_id)
+            # logger.debug("Status ID {} was not found in the database", status_id)
             return False
-        # logger.debug("Status ID %s was found in the database", status_id)
+        # logger.debug("Status ID {} was found in the database", status_id)
         return result
+
+    def search_status_row(self, status_id, fields=STATUS_ROW):
+        '''
+        Reads only the named fields of a status, as a namedtuple
+
+        status_id stands for the _id. One projected find_one, with no
+        cache; returns False if status_id does not exist.
+        '''
+        return bulk.find_row(self.database, status_id, fields, "status_id")
+
+    def exists(self, status_id):
+        '''
+        Checks whether a status exists with a query covered by the _id index
+        '''
+        return bulk.exists(self.database, status_id)
@@ -5,11 +5,16 @@ revised to work with database
 
 # pylint: disable=R0903
 
+import pymongo
 from loguru import logger
+from log_config import configure_logging
+import bulk
+
+# Default fields of the rows read by search_user_row
+USER_ROW = ("user_id", "user_email", "user_name", "user_last_name")
 
 # set-up logging for users.py
-logger.remove()
-logger.add("log_file_{time:YYYY_MMM_DD}.log")
+configure_logging()
 
 
 # logger.add(sys.stderr, level="ERROR")
@@ -23,35 +28,51 @@ class UserCollection():
     Contains a collection of Users objects
     '''
 
-    def __init__(self, database):
+    def __init__(self, database, cache=None):
         self.database = database
+        self.cache = cache
         logger.debug("User database successfully linked")
 
+    def _invalidate(self, user_id):
+        '''
+        Drops a user from the cache
+        '''
+        if self.cache is not None:
+            self.cache.invalidate(("user", user_id))
+
     def add_user(self, user_id, email, user_name, user_last_name):
         '''
         Adds a new user to the collection
         '''
-        if self.search_user(user_id):
-            # Rejects new user if user id already exists
-            logger.debug("User ID %s already exists in the database", user_id)
-            return False
         data = {"_id": user_id,
                 "user_email": email,
                 "user_name": user_name,
                 "user_last_name": user_last_name}
-        self.database.insert_one(data)
-        logger.debug("User ID %s successfully added to database", user_id)
+        try:
+            self.database.insert_one(data)
+        except pymongo.errors.DuplicateKeyError:
+            # Rejects new user if user id already exists
+            logger.debug("User ID {} already exists in the database", user_id)
+            return False
+        self._invalidate(user_id)
+        logger.debug("User ID {} successfully added to database", user_id)
         return True
 
     def batch_load_users(self, data):
         """
         Adds new users to the collection with a batch load
+
+        Duplicates are detected with a single $in query per batch; the batch
+        is rejected as a whole if any user ID repeats or already exists.
         """
-        for row in data:
-            if self.search_user(row["_id"]):
-                # Rejects new user batch if it contains a duplicate
-                logger.debug("User ID %s already exists in the database", row['_id'])
-                return False
+        user_ids = [row["_id"] for row in data]
+        if len(set(user_ids)) != len(user_ids):
+            logger.debug("User batch contains repeated user IDs")
+            return False
+        if self.database.count_documents({"_id": {"$in": user_ids}}, limit=1):
+            # Rejects new user batch if it contains a duplicate
+            logger.debug("User batch contains IDs already in the database")
+            return False
         self.database.insert_many(data)
         return True
 
@@ -59,36 +80,134 @@ class UserCollection():
         '''
         Modifies an existing user
         '''
-        results = self.search_user(user_id)
-        if not results:
-            logger.debug("User ID %s does not exist in the database", user_id)
-            return False
-        data = {"_id": user_id,
-                "user_email": email,
+        data = {"user_email": email,
                 "user_name": user_name,
                 "user_last_name": user_last_name}
-        self.database.update_one(results, {"$set": data})
-        logger.debug("User ID %s successfully modified in the database", user_id)
+        if not self.database.update_one({"_id": user_id}, {"$set": data}).matched_count:
+            logger.debug("User ID {} does not exist in the database", user_id)
+            return False
+        self._invalidate(user_id)
+        logger.debug("User ID {} successfully modified in the database", user_id)
         return True
 
     def delete_user(self, user_id):
         '''
         Deletes an existing user
         '''
-        if not self.search_user(user_id):
-            logger.debug("User ID %s does not exist in the database", user_id)
+        if not self.database.delete_one({"_id": user_id}).deleted_count:
+            logger.debug("User ID {} does not exist in the database", user_id)
             return False
-        self.database.delete_one({"_id": user_id})
-        logger.debug("User ID %s successfully deleted from the database", user_id)
+        self._invalidate(user_id)
+        logger.debug("User ID {} successfully deleted from the database", user_id)
         return True
 
+    def add_users(self, users):
+        '''
+        Adds many users with one unordered insert_many per chunk
+
+        users is an iterable of (user_id, email, user_name, user_last_name)
+        tuples. Returns a list of booleans in input order; an item is False
+        when its user ID already exists or repeats an earlier item.
+        '''
+        results = []
+        for chunk in bulk.chunked(users):
+            docs = [{"_id": user_id,
+                     "user_email": email,
+                     "user_name": user_name,
+                     "user_last_name": user_last_name}
+                    for user_id, email, user_name, user_last_name in chunk]
+            results.extend(bulk.insert_unordered(self.database, docs))
+            for doc in docs:
+                self._invalidate(doc["_id"])
+        logger.debug("Bulk added {} of {} users", sum(results), len(results))
+        return results
+
+    def modify_users(self, users):
+        '''
+        Modifies many users with one $in lookup and one bulk_write per chunk
+
+        users is an iterable of (user_id, email, user_name, user_last_name)
+        tuples. Returns a list of booleans in input order; an item is False
+        when its user ID does not exist.
+        '''
+        results = []
+        for chunk in bulk.chunked(users):
+            found = bulk.existing_ids(self.database, [row[0] for row in chunk])
+            requests = [pymongo.UpdateOne({"_id": user_id}, {"$set": {
+                "user_email": email,
+                "user_name": user_name,
+                "user_last_name": user_last_name}})
+                        for user_id, email, user_name, user_last_name in chunk
+                        if user_id in found]
+            if requests:
+                self.database.bulk_write(requests, ordered=False)
+            for row in chunk:
+                results.append(row[0] in found)
+                self._invalidate(row[0])
+        logger.debug("Bulk modified {} of {} users", sum(results), len(results))
+        return results
+
+    def delete_users(self, user_ids):
+        '''
+        Deletes many users with one $in lookup and one delete_many per chunk
+
+        Returns a list of booleans in input order; an item is False when the
+        user ID does not exist or was already deleted earlier in the call.
+        '''
+        results = []
+        for chunk in bulk.chunked(user_ids):
+            found = bulk.existing_ids(self.database, chunk)
+            if found:
+                self.database.delete_many({"_id": {"$in": list(found)}})
+            for user_id in chunk:
+                results.append(user_id in found)
+                found.discard(user_id)
+                self._invalidate(user_id)
+        logger.debug("Bulk deleted {} of {} users", sum(results), len(results))
+        return results
+
+    def search_users(self, user_ids):
+        '''
+        Searches for many users with one $in query per chunk
+
+        Returns a dict mapping each user ID that was found to its document;
+        IDs that do not exist are left out.
+        '''
+        return bulk.find_many(self.database, self.cache, "user", user_ids)
+
     def search_user(self, user_id):
         '''
         Searches for user data
+
+        Served from the cache when one was given to the collection.
+        '''
+        if self.cache is None:
+            return self._search_user(user_id)
+        return self.cache.get_or_load(("user", user_id), self._search_user, user_id)
+
+    def _search_user(self, user_id):
+        '''
+        Reads user data from the database
         '''
         results = self.database.find_one({"_id": user_id})
         if not results:
-            logger.debug("User ID %s was not found in the database", user_id)
+            logger.debug("User ID {} was not found in the database", user_id)
             return False
-        logger.debug("User ID %s was found in the database", user_id)
+        logger.debug("User ID {} was found in the database", user_id)
         return results
+
+
+    def search_user_row(self, user_id, fields=USER_ROW):
+        '''
+        Reads only the named fields of a user, as a namedtuple
+
+        user_id stands for the _id. One projected find_one, with no cache;
+        returns False if user_id does not exist.
+        '''
+        return bulk.find_row(self.database, user_id, fields, "user_id")
+
+    def exists(self, user_id):
+        '''
+        Checks whether a user exists with a query covered by the _id index
+        '''
+        return bulk.exists(self.database, user_id)
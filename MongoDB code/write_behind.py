@@ -0,0 +1,186 @@
+"""
+Write-behind queue that groups status writes into batched commits
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
+
+# Flush thresholds: rows per batch and seconds a queued row may wait
+MAX_BATCH = 1000
+FLUSH_INTERVAL = 0.01
+# Rows queued before add_status blocks the caller
+MAX_PENDING = 10000
+
+# Queue item that stops the writer thread
+_STOP = object()
+
+
+class WriteBehind:
+    """
+    Collects add_status calls in a bounded queue and stores them in batches
+
+    A writer thread takes rows off the queue and hands them to
+    write_batch(rows), a bulk method such as
+    UserStatusCollection.add_statuses that returns one boolean per row.
+    It writes once max_batch rows are waiting or flush_interval seconds
+    after the first of them was queued, whichever comes first, and runs
+    each write inside transaction(), so a batch costs one commit.
+
+    add_status returns a Future that resolves to the row's boolean once its
+    batch is stored, or raises the error the batch failed with. When
+    max_pending rows are queued add_status blocks, for at most timeout
+    seconds before raising queue.Full. cleanup(), if given, runs on the
+    writer thread when it stops. Rows still queued are lost if close() is
+    never called, so use the queue as a context manager. Once closed,
+    add_status and flush raise RuntimeError.
+    """
+
+    def __init__(
+        self,
+        write_batch,
+        max_batch=MAX_BATCH,
+        flush_interval=FLUSH_INTERVAL,
+        max_pending=MAX_PENDING,
+        transaction=nullcontext,
+        cleanup=None,
+    ):
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.transaction = transaction
+        self.cleanup = cleanup
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue(max_pending)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="write-behind", daemon=True
+        )
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_status(self, status_id, user_id, status_text, timeout=None):
+        """
+        Queues a status and returns a Future for the outcome of its write
+        """
+        # The put happens under the lock so nothing is queued behind _STOP
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise queue.Full
+        try:
+            self._check_open()
+            if deadline is not None:
+                timeout = max(0, deadline - time.monotonic())
+            future = Future()
+            self._queue.put(((status_id, user_id, status_text), future), timeout=timeout)
+        finally:
+            self._lock.release()
+        return future
+
+    def flush(self):
+        """
+        Writes everything queued so far and waits until it is stored
+        """
+        marker = Future()
+        with self._lock:
+            self._check_open()
+            self._queue.put(marker)
+        marker.result()
+
+    def close(self):
+        """
+        Writes the rows still queued and stops the writer thread
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+
+    def _check_open(self):
+        """
+        Raises RuntimeError once the queue is closed; call with _lock held
+        """
+        if self._closed:
+            raise RuntimeError("write-behind queue is closed")
+
+    def stats(self):
+        """
+        Returns the flush and row counters and the rows waiting
+        """
+        return {
+            "flushes": self.flushes,
+            "written": self.written,
+            "failed": self.failed,
+            "pending": self._queue.qsize(),
+            "max_batch": self.max_batch,
+            "flush_interval": self.flush_interval,
+        }
+
+    def _run(self):
+        """
+        Writer thread: gathers batches off the queue until stopped
+        """
+        try:
+            stop = False
+            while not stop:
+                item = self._queue.get()
+                deadline = time.monotonic() + self.flush_interval
+                batch = []
+                markers = []
+                while True:
+                    if item is _STOP:
+                        stop = True
+                        break
+                    if isinstance(item, Future):
+                        markers.append(item)
+                        break
+                    batch.append(item)
+                    remaining = deadline - time.monotonic()
+                    if len(batch) >= self.max_batch or remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                self._write(batch)
+                for marker in markers:
+                    marker.set_result(True)
+        finally:
+            if self.cleanup is not None:
+                self.cleanup()
+
+    def _write(self, batch):
+        """
+        Stores a batch and resolves its futures
+        """
+        batch = [
+            (row, future)
+            for row, future in batch
+            if future.set_running_or_notify_cancel()
+        ]
+        if not batch:
+            return
+        try:
+            with self.transaction():
+                results = self.write_batch([row for row, _ in batch])
+        except Exception as error:  # pylint: disable=broad-except
+            self.failed += len(batch)
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        self.flushes += 1
+        self.written += sum(results)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
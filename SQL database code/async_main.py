@@ -0,0 +1,135 @@
+"""
+asyncio front end for the social network project
+
+Mirrors the functions in main.py as coroutines. Every call runs on one
+dedicated executor thread, so all concurrent callers share that thread's
+SQLite connection and peewee is never used from two threads at once.
+"""
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+
+async def _run(func, *args, **kwargs):
+    """
+    Runs a blocking main.py function on the SQLite executor thread
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+async def load_users(filename, **kwargs):
+    """
+    Loads user accounts from a CSV file
+    """
+    return await _run(main.load_users, filename, **kwargs)
+
+
+async def load_status_updates(filename, **kwargs):
+    """
+    Loads status updates from a CSV file
+    """
+    return await _run(main.load_status_updates, filename, **kwargs)
+
+
+async def add_user(user_id, email, user_name, user_last_name, user_collection):
+    """
+    Creates a new user in user_collection
+    """
+    return await _run(
+        main.add_user, user_id, email, user_name, user_last_name, user_collection
+    )
+
+
+async def update_user(user_id, email, user_name, user_last_name, user_collection):
+    """
+    Updates the values of an existing user
+    """
+    return await _run(
+        main.update_user, user_id, email, user_name, user_last_name, user_collection
+    )
+
+
+async def delete_user(user_id, user_collection):
+    """
+    Deletes a user from user_collection
+    """
+    return await _run(main.delete_user, user_id, user_collection)
+
+
+async def search_user(user_id, user_collection):
+    """
+    Searches for a user in user_collection
+    """
+    return await _run(main.search_user, user_id, user_collection)
+
+
+async def add_status(user_id, status_id, status_text, status_collection):
+    """
+    Creates a new status in status_collection
+    """
+    return await _run(main.add_status, user_id, status_id, status_text, status_collection)
+
+
+async def update_status(status_id, user_id, status_text, status_collection):
+    """
+    Updates the values of an existing status
+    """
+    return await _run(
+        main.update_status, status_id, user_id, status_text, status_collection
+    )
+
+
+async def delete_status(status_id, status_collection):
+    """
+    Deletes a status from status_collection
+    """
+    return await _run(main.delete_status, status_id, status_collection)
+
+
+async def search_status(status_id, status_collection):
+    """
+    Searches for a status in status_collection
+    """
+    return await _run(main.search_status, status_id, status_collection)
+
+
+async def requests_per_second(concurrency, user_ids, user_collection):
+    """
+    Fires concurrency simultaneous search_user calls and returns requests/sec
+    """
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            search_user(user_ids[i % len(user_ids)], user_collection)
+            for i in range(concurrency)
+        )
+    )
+    return concurrency / (time.perf_counter() - start)
+
+
+async def _benchmark():
+    """
+    Reports search_user throughput for 100 to 1000 concurrent callers
+    """
+    user_collection = main.init_user_collection()
+    user_ids = [f"bench_user_{i}" for i in range(100)]
+    for user_id in user_ids:
+        await add_user(user_id, "bench@uw.edu", "bench", "user", user_collection)
+    for concurrency in (100, 250, 500, 1000):
+        rate = await requests_per_second(concurrency, user_ids, user_collection)
+        print(f"{concurrency} concurrent callers: {rate:.0f} requests/sec")
+    for user_id in user_ids:
+        await delete_user(user_id, user_collection)
+
+
+if __name__ == "__main__":
+    asyncio.run(_benchmark())
@@ -0,0 +1,644 @@
+"""
+Benchmark suite for the SQL database code
+
+Each operation is timed with time.perf_counter_ns over a number of warmup
+runs followed by many measured runs, and summarised as p50/p95/p99
+latencies. Results are written as JSON so two runs can be compared to
+catch regressions:
+
+    python benchmark.py --size 2k --output before.json
+    python benchmark.py --size 2k --output after.json
+    python benchmark.py --compare before.json after.json
+
+Set SOCIALNETWORK_STORAGE=compact to measure the integer-key table layout.
+"""
+
+import argparse
+import csv
+import gc
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import engine
+import ingest
+import main
+from log_config import configure_logging
+import socialnetwork_model
+from socialnetwork_model import db, StatusModel, UserModel
+
+# Number of status updates per dataset; there is one user per 100 statuses
+SIZES = {"2k": 2_000, "200k": 200_000, "2m": 2_000_000}
+# Parser process counts timed by the CSV parsing scenarios
+PARSE_PROCESSES = sorted({1, 2, 4, os.cpu_count() or 1})
+# Third-party packages that importing menu should no longer pull in
+HEAVY_MODULES = ("peewee", "pymongo", "loguru")
+# IDs per batch in the multi-get scenarios
+LOOKUP_SIZES = (10, 100, 1000)
+# Flush intervals, in seconds, of the write-behind scenarios
+FLUSH_INTERVALS = (0.001, 0.01, 0.1)
+
+
+def percentile(samples, pct):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    index = max(0, min(len(samples) - 1, round(pct / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+def measure(func, iterations=1000, warmup=100, before=None):
+    """
+    Calls func(i) warmup + iterations times and summarises the measured runs
+
+    before(i), if given, runs untimed ahead of every call. Latencies are
+    reported in microseconds.
+    """
+    samples = []
+    for i in range(warmup + iterations):
+        if before is not None:
+            before(i)
+        start = time.perf_counter_ns()
+        func(i)
+        elapsed = time.perf_counter_ns() - start
+        if i >= warmup:
+            samples.append(elapsed / 1000)
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "mean_us": sum(samples) / len(samples),
+        "min_us": samples[0],
+        "p50_us": percentile(samples, 50),
+        "p95_us": percentile(samples, 95),
+        "p99_us": percentile(samples, 99),
+        "max_us": samples[-1],
+    }
+
+
+def import_time(module, runs=5):
+    """
+    Cold-start cost of importing module in a fresh interpreter
+
+    Parses the -X importtime report of each run and keeps the fastest.
+    Returns the module's cumulative import time in microseconds, the number
+    of modules imported and which of HEAVY_MODULES were among them.
+    """
+    best = None
+    for _ in range(runs):
+        report = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stderr
+        lines = [
+            line.split("|")
+            for line in report.splitlines()
+            if line.startswith("import time:") and "[us]" not in line
+        ]
+        names = {name.strip() for _, _, name in lines}
+        cumulative = next(int(c) for _, c, name in lines if name.strip() == module)
+        if best is None or cumulative < best["cumulative_us"]:
+            best = {
+                "cumulative_us": cumulative,
+                "modules": len(lines),
+                "heavy_modules": [name for name in HEAVY_MODULES if name in names],
+            }
+    return best
+
+
+def logging_overhead(func, iterations, warmup, directory, before=None):
+    """
+    Times func with the old synchronous DEBUG file sink and with the default
+    configure_logging() set-up; returns both summaries
+    """
+    sink = os.path.join(directory, "benchmark.log")
+    configure_logging("DEBUG", sink=sink, enqueue=False, per_second=None)
+    legacy = measure(func, iterations, warmup, before)
+    configure_logging(sink=sink)
+    current = measure(func, iterations, warmup, before)
+    configure_logging()
+    return legacy, current
+
+
+def write_dataset(directory, statuses):
+    """
+    Writes synthetic accounts.csv and status_updates.csv files
+
+    The files use the same layout as the course data. Returns their paths.
+    """
+    user_count = max(1, statuses // 100)
+    accounts = os.path.join(directory, "accounts.csv")
+    status_updates = os.path.join(directory, "status_updates.csv")
+    with open(accounts, "w", encoding="utf-8", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["USER_ID", "EMAIL", "NAME", "LASTNAME"])
+        for i in range(user_count):
+            writer.writerow([f"User.Name{i}", f"user{i}@testmail.com", "User", f"Name{i}"])
+    with open(status_updates, "w", encoding="utf-8", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["STATUS_ID", "USER_ID", "STATUS_TEXT"])
+        for i in range(statuses):
+            writer.writerow(
+                [f"User.Name{i % user_count}_{i:07d}", f"User.Name{i % user_count}", f"Status number {i}"]
+            )
+    return accounts, status_updates
+
+
+def parse_status_file(filename, processes=None):
+    """
+    Parses a status CSV into batches without writing them; returns the rows
+    """
+    stats = ingest.LoadStats()
+    stats.batch_size = 1000
+    batches = ingest.load_batches(
+        filename, main.STATUS_COLUMNS, stats, processes=processes
+    )
+    return sum(len(batch) for batch in batches)
+
+
+def reader_footprint(filename, tuples=True):
+    """
+    Reads a status CSV with the tuple reader or the DictReader reference
+
+    Returns the rows/sec of a full pass and the memory blocks and bytes
+    held per row by one batch of 1000 rows.
+    """
+    stats = ingest.LoadStats()
+    stats.batch_size = 1000
+
+    def batches():
+        if tuples:
+            yield from ingest.load_batches(filename, main.STATUS_COLUMNS, stats)
+        else:
+            with open(filename, encoding="utf-8", newline="") as csvfile:
+                yield from ingest.read_batches(csvfile, main.STATUS_COLUMNS, stats)
+
+    gc.collect()
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    reader = batches()
+    batch = next(reader)
+    reader.close()
+    gc.collect()
+    blocks = (sys.getallocatedblocks() - blocks) / len(batch)
+    held = tracemalloc.get_traced_memory()[0] / len(batch)
+    tracemalloc.stop()
+    del batch
+    start = time.perf_counter()
+    rows = sum(len(batch) for batch in batches())
+    return {
+        "rows": rows,
+        "rows_per_sec": rows / (time.perf_counter() - start),
+        "blocks_per_row": blocks,
+        "bytes_per_row": held,
+    }
+
+
+def allocations(func, iterations=200):
+    """
+    Memory cost of a lookup func(i), as medians over iterations calls
+
+    Reports the memory blocks still allocated while the result is held,
+    which counts the objects making up the result, and the peak bytes
+    traced during the call, which also covers the temporaries.
+    """
+    blocks = []
+    peaks = []
+    gc.collect()
+    tracemalloc.start()
+    for i in range(iterations):
+        before = sys.getallocatedblocks()
+        tracemalloc.reset_peak()
+        traced = tracemalloc.get_traced_memory()[0]
+        result = func(i)
+        peaks.append(tracemalloc.get_traced_memory()[1] - traced)
+        blocks.append(sys.getallocatedblocks() - before)
+        del result
+    tracemalloc.stop()
+    blocks.sort()
+    peaks.sort()
+    return {
+        "blocks_per_result": percentile(blocks, 50),
+        "peak_bytes_per_call": percentile(peaks, 50),
+    }
+
+
+def reset_tables(_=None):
+    """
+    Drops and recreates the tables and the full-text index
+    """
+    socialnetwork_model.drop_text_index()
+    db.drop_tables([UserModel, StatusModel])
+    db.create_tables([UserModel, StatusModel])
+    socialnetwork_model.create_text_index()
+
+
+def lookup_batches(search_one, search_many, ids, iterations, warmup):
+    """
+    Times resolving ids with one multi-get call against a loop of single
+    lookups; returns both summaries
+    """
+    return (
+        measure(lambda i: search_many(ids), iterations, warmup),
+        measure(lambda i: [search_one(key) for key in ids], iterations, warmup),
+    )
+
+
+def write_behind_throughput(writes, count, prefix, user_ids):
+    """
+    Queues count statuses on a write_behind.WriteBehind as fast as one
+    thread can and waits until they are stored
+
+    Returns the statuses stored per second, the flushes it took and the
+    p50/p99 wait from add_status until a status was stored.
+    """
+    waits = []
+    futures = []
+    start = time.perf_counter()
+    for i in range(count):
+        future = writes.add_status(f"{prefix}{i}", user_ids[i % len(user_ids)], "text")
+        queued = time.perf_counter()
+        future.add_done_callback(
+            lambda _, queued=queued: waits.append(time.perf_counter() - queued)
+        )
+        futures.append(future)
+    stored = sum(future.result() for future in futures)
+    elapsed = time.perf_counter() - start
+    # Callbacks run on the writer thread after result() returns
+    writes.flush()
+    waits.sort()
+    return {
+        "stored": stored,
+        "statuses_per_sec": count / elapsed,
+        "flushes": writes.flushes,
+        "p50_wait_us": percentile(waits, 50) * 1e6,
+        "p99_wait_us": percentile(waits, 99) * 1e6,
+    }
+
+
+def engine_workload(store, accounts, status_updates, user_count, iterations, warmup):
+    """
+    Times the same workload against any engine.StorageEngine
+
+    The engine is cleared and loaded with the dataset first. Returns the
+    summaries keyed "engine_<engine name>_<operation>", so the memory
+    engine's figures show how much of each operation the database costs.
+    """
+    store.clear()
+    prefix = f"engine_{store.name}_"
+    results = {
+        f"{prefix}load": measure(
+            lambda i: (
+                store.load_users(accounts),
+                store.load_status_updates(status_updates),
+            ),
+            1,
+            0,
+        )
+    }
+    operations = {
+        "add_user": lambda i: store.add_user(f"bench_{i}", "a@uw.edu", "a", "a"),
+        "update_user": lambda i: store.update_user(f"bench_{i}", "c@uw.edu", "c", "c"),
+        "search_user": lambda i: store.search_user(f"bench_{i}"),
+        "search_users_page": lambda i: store.search_users(
+            [f"User.Name{(i + j) % user_count}" for j in range(25)]
+        ),
+        "add_status": lambda i: store.add_status(f"bench_{i}", f"bench_s{i}", "text"),
+        "update_status": lambda i: store.update_status(
+            f"bench_s{i}", f"bench_{i}", "new"
+        ),
+        "search_status": lambda i: store.search_status(f"bench_s{i}"),
+        "user_timeline": lambda i: store.get_user_statuses(
+            f"User.Name{i % user_count}"
+        ),
+        "search_statuses_by_text": lambda i: store.search_statuses_by_text(str(i)),
+        "delete_status": lambda i: store.delete_status(f"bench_s{i}"),
+        "delete_user": lambda i: store.delete_user(f"bench_{i}"),
+    }
+    for name, func in operations.items():
+        results[prefix + name] = measure(func, iterations, warmup)
+    return results
+
+
+def run_suite(size, iterations, warmup, load_repeats, directory):
+    """
+    Runs every scenario against a fresh database file in directory
+    """
+    results = {"import_menu": import_time("menu")}
+    main.init_database(os.path.join(directory, "benchmark.db"))
+    reset_tables()
+    accounts, status_updates = write_dataset(directory, SIZES[size])
+    user_collection = main.init_user_collection()
+    status_collection = main.init_status_collection()
+
+    results["load_users"] = measure(
+        lambda i: main.load_users(accounts), load_repeats, 0, reset_tables
+    )
+    (
+        results["load_users_log_debug_sync"],
+        results["load_users_log_default"],
+    ) = logging_overhead(
+        lambda i: main.load_users(accounts), load_repeats, 0, directory, reset_tables
+    )
+    results["load_status_updates"] = measure(
+        lambda i: main.load_status_updates(status_updates),
+        load_repeats,
+        0,
+        lambda i: (reset_tables(), main.load_users(accounts)),
+    )
+    results["parse_status_updates"] = measure(
+        lambda i: parse_status_file(status_updates), load_repeats, 0
+    )
+    for processes in PARSE_PROCESSES:
+        results[f"parse_status_updates_{processes}proc"] = measure(
+            lambda i, n=processes: parse_status_file(status_updates, n),
+            load_repeats,
+            0,
+        )
+    results["reader_dict"] = reader_footprint(status_updates, tuples=False)
+    results["reader_tuple"] = reader_footprint(status_updates)
+    results["load_status_no_text_index"] = measure(
+        lambda i: main.load_status_updates(status_updates),
+        load_repeats,
+        0,
+        lambda i: (
+            reset_tables(),
+            socialnetwork_model.drop_text_index(),
+            main.load_users(accounts),
+        ),
+    )
+    results["load_status_updates_bulk"] = measure(
+        lambda i: main.load_status_updates(status_updates, bulk=True),
+        load_repeats,
+        0,
+        lambda i: (reset_tables(), main.load_users(accounts)),
+    )
+    results["load_status_updates_checkpointed"] = measure(
+        lambda i: main.load_status_updates(
+            status_updates, checkpoint_file=status_updates + ".checkpoint"
+        ),
+        load_repeats,
+        0,
+        lambda i: (reset_tables(), main.load_users(accounts)),
+    )
+    reset_tables()
+    main.load_users(accounts)
+    load_stats = ingest.LoadStats()
+    main.load_status_updates(status_updates, stats=load_stats)
+    results["load_status_updates_memory"] = {
+        "rows": load_stats.rows,
+        "rows_per_sec": load_stats.rows_per_sec,
+        "peak_memory_bytes": load_stats.peak_memory,
+    }
+    results["database_size"] = {
+        "storage": socialnetwork_model.STORAGE_MODE,
+        "bytes": db.pragma("page_count") * db.pragma("page_size"),
+    }
+    user_count = SIZES[size] // 100
+    results["user_timeline_first_page"] = measure(
+        lambda i: list(
+            main.get_user_statuses(f"User.Name{i % user_count}", status_collection)
+        ),
+        iterations,
+        warmup,
+    )
+    results["user_timeline_next_page"] = measure(
+        lambda i: list(
+            main.get_user_statuses(
+                f"User.Name{i % user_count}",
+                status_collection,
+                after=f"User.Name{i % user_count}_{SIZES[size] // 2:07d}",
+            )
+        ),
+        iterations,
+        warmup,
+    )
+    results["search_statuses_by_text"] = measure(
+        lambda i: main.search_statuses_by_text(str(i), status_collection),
+        iterations,
+        warmup,
+    )
+
+    # A page of statuses and their authors, resolved by one multi-get or one
+    # lookup per ID; authors repeat as they would on a real page
+    for count in LOOKUP_SIZES:
+        runs = max(10, iterations * 10 // count)
+        status_ids = [
+            f"User.Name{k % user_count}_{k:07d}"
+            for k in range(0, SIZES[size], SIZES[size] // count)
+        ]
+        (
+            results[f"search_statuses_{count}"],
+            results[f"search_status_loop_{count}"],
+        ) = lookup_batches(
+            status_collection.search_status,
+            status_collection.search_statuses,
+            status_ids,
+            runs,
+            min(warmup, runs),
+        )
+        (
+            results[f"search_users_{count}"],
+            results[f"search_user_loop_{count}"],
+        ) = lookup_batches(
+            user_collection.search_user,
+            user_collection.search_users,
+            [status_id.rsplit("_", 1)[0] for status_id in status_ids],
+            runs,
+            min(warmup, runs),
+        )
+
+    results["add_user"] = measure(
+        lambda i: user_collection.add_user(f"bench_{i}", "b@uw.edu", "b", "b"),
+        iterations,
+        warmup,
+    )
+    results["update_user"] = measure(
+        lambda i: user_collection.modify_user(f"bench_{i}", "c@uw.edu", "c", "c"),
+        iterations,
+        warmup,
+    )
+    results["search_user"] = measure(
+        lambda i: user_collection.search_user(f"bench_{i}"), iterations, warmup
+    )
+    results["search_user_row"] = measure(
+        lambda i: user_collection.search_user_row(f"bench_{i}"), iterations, warmup
+    )
+    results["user_exists"] = measure(
+        lambda i: user_collection.exists(f"bench_{i}"), iterations, warmup
+    )
+    (
+        results["search_user_log_debug_sync"],
+        results["search_user_log_default"],
+    ) = logging_overhead(
+        lambda i: user_collection.search_user(f"bench_{i}"),
+        iterations,
+        warmup,
+        directory,
+    )
+    results["add_status"] = measure(
+        lambda i: status_collection.add_status(f"bench_s{i}", f"bench_{i}", "text"),
+        iterations,
+        warmup,
+    )
+    results["update_status"] = measure(
+        lambda i: status_collection.modify_status(f"bench_s{i}", f"bench_{i}", "new"),
+        iterations,
+        warmup,
+    )
+    results["search_status"] = measure(
+        lambda i: status_collection.search_status(f"bench_s{i}"), iterations, warmup
+    )
+    results["search_status_row"] = measure(
+        lambda i: status_collection.search_status_row(f"bench_s{i}"),
+        iterations,
+        warmup,
+    )
+    results["status_exists"] = measure(
+        lambda i: status_collection.exists(f"bench_s{i}"), iterations, warmup
+    )
+    # Full model instances against projected rows and existence checks
+    lookups = {
+        "search_user": lambda i: user_collection.search_user(f"bench_{i}"),
+        "search_user_row": lambda i: user_collection.search_user_row(f"bench_{i}"),
+        "user_exists": lambda i: user_collection.exists(f"bench_{i}"),
+        "search_status": lambda i: status_collection.search_status(f"bench_s{i}"),
+        "search_status_row": (
+            lambda i: status_collection.search_status_row(f"bench_s{i}")
+        ),
+        "status_exists": lambda i: status_collection.exists(f"bench_s{i}"),
+    }
+    for name, lookup in lookups.items():
+        results[f"{name}_allocations"] = allocations(lookup, min(iterations, 200))
+    results["delete_status"] = measure(
+        lambda i: status_collection.delete_status(f"bench_s{i}"), iterations, warmup
+    )
+    # Write-behind batches at each flush interval against one add_status
+    # call, and one commit, per status; the statuses are removed afterwards
+    user_ids = [f"User.Name{k}" for k in range(user_count)]
+    count = iterations * 5
+    start = time.perf_counter()
+    for i in range(count):
+        status_collection.add_status(f"direct_{i}", user_ids[i % user_count], "text")
+    results["add_status_direct"] = {
+        "statuses_per_sec": count / (time.perf_counter() - start)
+    }
+    written = [f"direct_{i}" for i in range(count)]
+    for interval in FLUSH_INTERVALS:
+        prefix = f"wb{interval * 1000:g}ms_"
+        with main.init_write_behind(
+            status_collection, flush_interval=interval
+        ) as writes:
+            results[f"write_behind_{interval * 1000:g}ms"] = write_behind_throughput(
+                writes, count, prefix, user_ids
+            )
+        written.extend(f"{prefix}{i}" for i in range(count))
+    status_collection.delete_statuses(written)
+    results["delete_user"] = measure(
+        lambda i: user_collection.delete_user(f"bench_{i}"), iterations, warmup
+    )
+    results["connection_pool"] = db.pool_metrics()
+    for store in (engine.MemoryEngine(), engine.SQLEngine()):
+        results.update(
+            engine_workload(
+                store, accounts, status_updates, user_count, iterations, warmup
+            )
+        )
+    return {
+        "meta": {
+            "backend": "sql",
+            "size": size,
+            "statuses": SIZES[size],
+            "iterations": iterations,
+            "warmup": warmup,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlite": sqlite3.sqlite_version,
+            "storage": socialnetwork_model.STORAGE_MODE,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.10):
+    """
+    Prints p50/p95/p99 changes between two result files
+
+    Returns the names of scenarios whose p50 or p95 grew by more than
+    threshold (a fraction).
+    """
+    regressions = []
+    for name, new in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None or "p50_us" not in new:
+            continue
+        changes = {
+            key: (new[key] - old[key]) / old[key] if old[key] else 0.0
+            for key in ("p50_us", "p95_us", "p99_us")
+        }
+        flagged = changes["p50_us"] > threshold or changes["p95_us"] > threshold
+        if flagged:
+            regressions.append(name)
+        print(
+            f"{name:28} p50 {old['p50_us']:10.1f} -> {new['p50_us']:10.1f}us "
+            f"({changes['p50_us']:+.1%})  p95 {changes['p95_us']:+.1%}  "
+            f"p99 {changes['p99_us']:+.1%}{'  REGRESSION' if flagged else ''}"
+        )
+    return regressions
+
+
+def print_results(report):
+    """
+    Prints one line per scenario
+    """
+    for name, summary in report["results"].items():
+        if "p50_us" in summary:
+            print(
+                f"{name:28} p50 {summary['p50_us']:10.1f}us  "
+                f"p95 {summary['p95_us']:10.1f}us  p99 {summary['p99_us']:10.1f}us"
+            )
+        else:
+            print(f"{name:28} {summary}")
+
+
+def parse_args(argv=None):
+    """
+    Command line options
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", choices=SIZES, default="2k")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--load-repeats", type=int, default=3)
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"))
+    parser.add_argument("--threshold", type=float, default=0.10)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as base_file, open(
+            args.compare[1], encoding="utf-8"
+        ) as current_file:
+            found = compare(json.load(base_file), json.load(current_file), args.threshold)
+        sys.exit(1 if found else 0)
+    with tempfile.TemporaryDirectory() as workdir:
+        output = run_suite(
+            args.size, args.iterations, args.warmup, args.load_repeats, workdir
+        )
+        db.close_all()
+    print_results(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as json_file:
+            json.dump(output, json_file, indent=2)
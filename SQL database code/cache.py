@@ -0,0 +1,181 @@
+"""
+Bounded in-process read-through cache for user and status lookups
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Least-recently-used cache whose entries also expire after ttl seconds
+
+    Keys are (kind, id) tuples such as ("user", "Larisa.Yesima75") so one
+    cache can be shared by a UserCollection and a UserStatusCollection.
+    Loaders run outside the lock; a value loaded while its key was
+    invalidated, or the cache cleared, is returned but not cached.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by clear and invalidate_where, which affect every key
+        self._epoch = 0
+        # [generation, loads in flight] of each key being loaded
+        self._loading = {}
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Stores value under key, evicting the least recently used entry if full
+        """
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        """
+        put without taking the lock
+        """
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_load(self, key, loader, *args):
+        """
+        Returns the cached value for key, calling loader(*args) on a miss
+
+        Falsy results (lookups that found nothing) are not cached, and
+        neither is a value whose key was invalidated while it loaded.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            state = self._loading.setdefault(key, [0, 0])
+            state[1] += 1
+            started = (self._epoch, state[0])
+        try:
+            value = loader(*args)
+        finally:
+            with self._lock:
+                state[1] -= 1
+                if not state[1]:
+                    del self._loading[key]
+                if value and (self._epoch, state[0]) == started:
+                    self._store(key, value)
+        return value
+
+    def get_or_load_many(self, kind, ids, loader):
+        """
+        Returns a dict mapping those of ids found to their values, calling
+        loader(missing) once with the list of ids not cached under
+        (kind, id)
+
+        loader returns a dict of the ids it found. Its values are cached as
+        in get_or_load: not when the key was invalidated while they loaded.
+        """
+        found = {}
+        missing = []
+        for key in dict.fromkeys(ids):
+            value = self.get((kind, key))
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if not missing:
+            return found
+        with self._lock:
+            states = [self._loading.setdefault((kind, key), [0, 0]) for key in missing]
+            for state in states:
+                state[1] += 1
+            epoch = self._epoch
+            started = [state[0] for state in states]
+        loaded = {}
+        try:
+            loaded = loader(missing)
+        finally:
+            with self._lock:
+                current = self._epoch == epoch
+                for key, state, generation in zip(missing, states, started):
+                    state[1] -= 1
+                    if not state[1]:
+                        del self._loading[(kind, key)]
+                    value = loaded.get(key)
+                    if value and current and state[0] == generation:
+                        self._store((kind, key), value)
+        found.update(loaded)
+        return found
+
+    def invalidate(self, key):
+        """
+        Drops key from the cache if present
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            state = self._loading.get(key)
+            if state is not None:
+                state[0] += 1
+
+    def invalidate_where(self, predicate):
+        """
+        Drops every entry for which predicate(key, value) is true
+        """
+        with self._lock:
+            stale = [
+                key
+                for key, (value, _) in self._entries.items()
+                if predicate(key, value)
+            ]
+            for key in stale:
+                del self._entries[key]
+            # Values still loading cannot be checked against predicate
+            self._epoch += 1
+
+    def clear(self):
+        """
+        Empties the cache without resetting the counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self._epoch += 1
+
+    def stats(self):
+        """
+        Returns the hit/miss/eviction counters and current size
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
@@ -0,0 +1,459 @@
+"""
+Storage-engine interface for the social network
+
+StorageEngine is the one set of operations every backend offers, so the
+same workload can run against any of them. MemoryEngine keeps everything
+in dicts and does no I/O, which makes it the baseline the database
+engines are measured against; SQLEngine runs on the SQLite database.
+"""
+
+# pylint: disable=import-outside-toplevel
+
+import re
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from collections import Counter
+from heapq import nsmallest
+from operator import itemgetter
+
+import ingest
+import main
+
+WORD = re.compile(r"\w+")
+
+
+class User:
+    """
+    A user as returned by every engine
+    """
+
+    __slots__ = ("user_id", "user_email", "user_name", "user_last_name")
+
+    def __init__(self, user_id, user_email, user_name, user_last_name):
+        self.user_id = user_id
+        self.user_email = user_email
+        self.user_name = user_name
+        self.user_last_name = user_last_name
+
+    def __eq__(self, other):
+        return isinstance(other, User) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self):
+        return f"User({self.user_id!r}, {self.user_email!r})"
+
+
+class Status:
+    """
+    A status update as returned by every engine
+    """
+
+    __slots__ = ("status_id", "user_id", "status_text")
+
+    def __init__(self, status_id, user_id, status_text):
+        self.status_id = status_id
+        self.user_id = user_id
+        self.status_text = status_text
+
+    def __eq__(self, other):
+        return isinstance(other, Status) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self):
+        return f"Status({self.status_id!r}, {self.user_id!r})"
+
+
+class StorageEngine(ABC):
+    """
+    Operations every storage engine provides
+
+    Mutations return True on success and False when the IDs involved do
+    not allow it. Lookups return User and Status records, or False when
+    nothing matches; treat the records as read-only.
+    """
+
+    name = None
+
+    @abstractmethod
+    def clear(self):
+        """
+        Removes every user and status
+        """
+
+    @abstractmethod
+    def add_user(self, user_id, email, user_name, user_last_name):
+        """
+        Adds a user; False if user_id already exists
+        """
+
+    @abstractmethod
+    def update_user(self, user_id, email, user_name, user_last_name):
+        """
+        Replaces a user's details; False if user_id does not exist
+        """
+
+    @abstractmethod
+    def delete_user(self, user_id):
+        """
+        Deletes a user together with their statuses
+        """
+
+    @abstractmethod
+    def search_user(self, user_id):
+        """
+        Returns the User with user_id, or False
+        """
+
+    @abstractmethod
+    def search_users(self, user_ids):
+        """
+        Returns a dict mapping those of user_ids that exist to their Users,
+        using a fixed number of lookups
+        """
+
+    @abstractmethod
+    def add_status(self, user_id, status_id, status_text):
+        """
+        Adds a status; False if status_id exists or user_id does not
+        """
+
+    @abstractmethod
+    def update_status(self, status_id, user_id, status_text):
+        """
+        Replaces the text of status_id; False if it does not exist or
+        user_id does not own it
+        """
+
+    @abstractmethod
+    def delete_status(self, status_id):
+        """
+        Deletes a status; False if status_id does not exist
+        """
+
+    @abstractmethod
+    def search_status(self, status_id):
+        """
+        Returns the Status with status_id, or False
+        """
+
+    @abstractmethod
+    def search_statuses(self, status_ids):
+        """
+        Returns a dict mapping those of status_ids that exist to their
+        Statuses, using a fixed number of lookups
+        """
+
+    @abstractmethod
+    def get_user_statuses(self, user_id, after=None, limit=25):
+        """
+        Returns up to limit Statuses of user_id in descending status_id
+        order, starting below after when it is given
+        """
+
+    @abstractmethod
+    def search_statuses_by_text(self, query, limit=25):
+        """
+        Returns up to limit Statuses matching any word of query, best first
+        """
+
+    @abstractmethod
+    def load_users(self, filename):
+        """
+        Adds the users of an accounts CSV file; False if the load failed
+        """
+
+    @abstractmethod
+    def load_status_updates(self, filename):
+        """
+        Adds the statuses of a status updates CSV file; False if the load
+        failed
+        """
+
+
+class MemoryEngine(StorageEngine):
+    """
+    Engine keeping users and statuses in dicts of __slots__ records
+
+    Secondary indexes: a sorted list of status IDs per user serves
+    timelines and the cascade in delete_user, and an inverted index of
+    lower-cased words serves text search. Words are not stemmed, unlike in
+    the database text indexes. Nothing is persisted and nothing is locked,
+    so use an engine from one thread at a time.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.users = {}
+        self.statuses = {}
+        self.timelines = {}
+        self.words = {}
+
+    def _index(self, status):
+        """
+        Adds a status to the word index
+        """
+        for word in set(WORD.findall(status.status_text.lower())):
+            self.words.setdefault(word, set()).add(status.status_id)
+
+    def _unindex(self, status):
+        """
+        Removes a status from the word index
+        """
+        for word in set(WORD.findall(status.status_text.lower())):
+            ids = self.words[word]
+            ids.discard(status.status_id)
+            if not ids:
+                del self.words[word]
+
+    def clear(self):
+        self.users.clear()
+        self.statuses.clear()
+        self.timelines.clear()
+        self.words.clear()
+
+    def add_user(self, user_id, email, user_name, user_last_name):
+        if user_id in self.users:
+            return False
+        self.users[user_id] = User(user_id, email, user_name, user_last_name)
+        self.timelines[user_id] = []
+        return True
+
+    def update_user(self, user_id, email, user_name, user_last_name):
+        user = self.users.get(user_id)
+        if user is None:
+            return False
+        user.user_email = email
+        user.user_name = user_name
+        user.user_last_name = user_last_name
+        return True
+
+    def delete_user(self, user_id):
+        if self.users.pop(user_id, None) is None:
+            return False
+        for status_id in self.timelines.pop(user_id):
+            self._unindex(self.statuses.pop(status_id))
+        return True
+
+    def search_user(self, user_id):
+        return self.users.get(user_id, False)
+
+    def search_users(self, user_ids):
+        return {
+            user_id: self.users[user_id]
+            for user_id in user_ids
+            if user_id in self.users
+        }
+
+    def add_status(self, user_id, status_id, status_text):
+        if status_id in self.statuses or user_id not in self.users:
+            return False
+        status = Status(status_id, user_id, status_text)
+        self.statuses[status_id] = status
+        insort(self.timelines[user_id], status_id)
+        self._index(status)
+        return True
+
+    def update_status(self, status_id, user_id, status_text):
+        status = self.statuses.get(status_id)
+        if status is None or status.user_id != user_id:
+            return False
+        self._unindex(status)
+        status.status_text = status_text
+        self._index(status)
+        return True
+
+    def delete_status(self, status_id):
+        status = self.statuses.pop(status_id, None)
+        if status is None:
+            return False
+        timeline = self.timelines[status.user_id]
+        del timeline[bisect_left(timeline, status_id)]
+        self._unindex(status)
+        return True
+
+    def search_status(self, status_id):
+        return self.statuses.get(status_id, False)
+
+    def search_statuses(self, status_ids):
+        return {
+            status_id: self.statuses[status_id]
+            for status_id in status_ids
+            if status_id in self.statuses
+        }
+
+    def get_user_statuses(self, user_id, after=None, limit=25):
+        timeline = self.timelines.get(user_id, [])
+        end = len(timeline) if after is None else bisect_left(timeline, after)
+        page = timeline[max(0, end - limit) : end]
+        return [self.statuses[status_id] for status_id in reversed(page)]
+
+    def search_statuses_by_text(self, query, limit=25):
+        hits = Counter()
+        for word in set(WORD.findall(query.lower())):
+            hits.update(self.words.get(word, ()))
+        # Most words matched first, then by status ID
+        best = nsmallest(limit, hits, key=lambda key: (-hits[key], key))
+        return [self.statuses[status_id] for status_id in best]
+
+    def load_users(self, filename):
+        """
+        Adds the users of an accounts CSV file in one step
+
+        Nothing is added when a user ID repeats or already exists.
+        """
+        import validation
+
+        added = {}
+        try:
+            rows = ingest.map_rows(filename, main.USER_COLUMNS)
+            layout = validation.detect_layout(filename, main.USER_COLUMNS)
+            if layout:
+                rows = map(itemgetter(*layout), rows)
+            for user_id, email, user_name, user_last_name in rows:
+                if user_id in added or user_id in self.users:
+                    return False
+                added[user_id] = User(user_id, email, user_name, user_last_name)
+        except (FileNotFoundError, KeyError):
+            return False
+        self.users.update(added)
+        for user_id in added:
+            self.timelines[user_id] = []
+        return True
+
+    def load_status_updates(self, filename):
+        """
+        Adds the statuses of a status updates CSV file in one step
+
+        Nothing is added when a status ID repeats or already exists, or a
+        status belongs to an unknown user.
+        """
+        added = {}
+        try:
+            for status_id, user_id, status_text in ingest.map_rows(
+                filename, main.STATUS_COLUMNS
+            ):
+                if (
+                    status_id in added
+                    or status_id in self.statuses
+                    or user_id not in self.users
+                ):
+                    return False
+                added[status_id] = Status(status_id, user_id, status_text)
+        except (FileNotFoundError, KeyError):
+            return False
+        self.statuses.update(added)
+        owners = set()
+        for status in added.values():
+            self.timelines[status.user_id].append(status.status_id)
+            owners.add(status.user_id)
+            self._index(status)
+        for user_id in owners:
+            self.timelines[user_id].sort()
+        return True
+
+
+class SQLEngine(StorageEngine):
+    """
+    Engine on the SQLite database, through main and its collections
+
+    path selects the database file as in main.init_database; cache is
+    shared by the user and status collections.
+    """
+
+    name = "sql"
+
+    def __init__(self, path=None, cache=None):
+        self.model = main.init_database(path)
+        self.cache = cache
+        self.users = main.init_user_collection(cache)
+        self.statuses = main.init_status_collection(cache)
+
+    @staticmethod
+    def _user(user):
+        """
+        Turns a UserModel row into a User
+        """
+        return User(user.user_id, user.user_email, user.user_name, user.user_last_name)
+
+    def _status(self, status):
+        """
+        Turns a StatusModel row into a Status
+        """
+        return Status(
+            status.status_id, self.model.status_owner(status), status.status_text
+        )
+
+    def clear(self):
+        self.model.StatusModel.delete().execute()
+        self.model.UserModel.delete().execute()
+        if self.cache is not None:
+            self.cache.clear()
+
+    def add_user(self, user_id, email, user_name, user_last_name):
+        return self.users.add_user(user_id, email, user_name, user_last_name)
+
+    def update_user(self, user_id, email, user_name, user_last_name):
+        return self.users.modify_user(user_id, email, user_name, user_last_name)
+
+    def delete_user(self, user_id):
+        return self.users.delete_user(user_id)
+
+    def search_user(self, user_id):
+        user = self.users.search_user(user_id)
+        return self._user(user) if user else False
+
+    def search_users(self, user_ids):
+        return {
+            user_id: self._user(user)
+            for user_id, user in self.users.search_users(user_ids).items()
+        }
+
+    def add_status(self, user_id, status_id, status_text):
+        return self.statuses.add_status(status_id, user_id, status_text)
+
+    def update_status(self, status_id, user_id, status_text):
+        return self.statuses.modify_own_status(status_id, user_id, status_text)
+
+    def delete_status(self, status_id):
+        return self.statuses.delete_status(status_id)
+
+    def search_status(self, status_id):
+        status = self.statuses.search_status(status_id)
+        return self._status(status) if status else False
+
+    def search_statuses(self, status_ids):
+        return {
+            status_id: self._status(status)
+            for status_id, status in self.statuses.search_statuses(status_ids).items()
+        }
+
+    def get_user_statuses(self, user_id, after=None, limit=25):
+        return [
+            self._status(status)
+            for status in self.statuses.get_user_statuses(user_id, after, limit)
+        ]
+
+    def search_statuses_by_text(self, query, limit=25):
+        return [
+            self._status(status)
+            for status in self.statuses.search_statuses_by_text(query, limit)
+        ]
+
+    def load_users(self, filename):
+        from peewee import IntegrityError
+
+        try:
+            return main.load_users(filename)
+        except IntegrityError:
+            return False
+
+    def load_status_updates(self, filename):
+        from peewee import IntegrityError
+
+        try:
+            return main.load_status_updates(filename)
+        except IntegrityError:
+            return False
@@ -0,0 +1,545 @@
+"""
+Streaming CSV ingestion for the social network loaders
+
+Rows are read, validated and written one bounded batch at a time so the
+memory used by a load does not grow with the size of the input file. The
+file is memory-mapped and rows are handed on as plain tuples; parsing can
+also be spread over several processes, each handling a newline-aligned
+byte range of the file. resumable_load commits in chunks and records its
+progress in a Checkpoint so an interrupted load can carry on where it
+stopped.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Bytes of CSV handed to a parser process at a time
+CHUNK_BYTES = 1024 * 1024
+# Bytes of CSV decoded at a time by the single-threaded reader; small
+# enough to keep a load's peak memory low without slowing the parse
+READ_CHUNK_BYTES = 16 * 1024
+# Rows committed between two checkpoints of a resumable load
+CHECKPOINT_ROWS = 10000
+# Bytes at the start of a CSV hashed to recognise it when a load resumes
+CHECKPOINT_HEAD_BYTES = 64 * 1024
+
+
+def memory_in_use():
+    """
+    Resident memory of the process in bytes, read without tracing allocations
+
+    Comes from /proc on Linux; elsewhere it is the peak resident size that
+    getrusage reports, or 0 where that is not available either.
+    """
+    try:
+        with open("/proc/self/statm", "rb") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB on other systems
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class LoadStats:
+    """
+    Throughput and memory figures collected during a single CSV load
+
+    rows counts the rows written: those handed to the writer less the ones
+    a validation.Quarantine rejected. peak_memory is the most resident
+    memory, in bytes, the load added to the process.
+    """
+
+    def __init__(self):
+        self.batch_size = 0
+        self.handed = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.reasons = {}
+        self.batches = 0
+        self.elapsed = 0.0
+        self.peak_memory = 0
+
+    @property
+    def rows(self):
+        """
+        Rows written, not counting rejected ones
+        """
+        return self.handed - self.rejected
+
+    @property
+    def rows_per_sec(self):
+        """
+        Rows written per second of wall-clock time
+        """
+        if not self.elapsed:
+            return 0.0
+        return self.rows / self.elapsed
+
+    @property
+    def reject_rate(self):
+        """
+        Fraction of the rows handed to the writer that were quarantined
+        """
+        if not self.handed:
+            return 0.0
+        return self.rejected / self.handed
+
+    def __str__(self):
+        summary = (
+            f"{self.rows} rows written in {self.batches} batches "
+            f"({self.skipped} skipped, {self.rejected} rejected) in {self.elapsed:.2f}s, "
+            f"{self.rows_per_sec:.0f} rows/sec, "
+            f"peak memory {self.peak_memory / 1024 / 1024:.1f} MiB"
+        )
+        if self.reasons:
+            summary += f"; reject rate {self.reject_rate:.2%}: " + ", ".join(
+                f"{reason} {count}" for reason, count in sorted(self.reasons.items())
+            )
+        return summary
+
+
+class MemoryWatch:
+    """
+    Samples the memory a load has added to the process after each batch
+
+    The highest figure goes to stats.peak_memory. With max_memory_mb set,
+    stats.batch_size is halved whenever a batch sets a new high above that
+    ceiling; only new highs count, since freed memory is not always handed
+    back to the operating system. Reading the figure costs microseconds,
+    unlike tracemalloc, which slows a load several times over.
+    """
+
+    def __init__(self, stats, max_memory_mb=None):
+        self.stats = stats
+        self.ceiling = max_memory_mb * 1024 * 1024 if max_memory_mb else None
+        self.baseline = memory_in_use()
+
+    def sample(self):
+        """
+        Records the memory in use now and shrinks the batch size if needed
+        """
+        used = memory_in_use() - self.baseline
+        if used > self.stats.peak_memory:
+            if self.ceiling and used > self.ceiling and self.stats.batch_size > 1:
+                self.stats.batch_size //= 2
+            self.stats.peak_memory = used
+
+
+def file_signature(filename):
+    """
+    Size and a hash of the first bytes of filename, which together tell one
+    file from another
+
+    The modification time is left out so a row fixed further into the file
+    without changing its length does not block resuming.
+    """
+    with open(filename, "rb") as binary:
+        head = hashlib.sha256(binary.read(CHECKPOINT_HEAD_BYTES)).hexdigest()
+    return {"size": os.path.getsize(filename), "head": head}
+
+
+class Checkpoint:
+    """
+    Progress of a resumable load, kept in a JSON sidecar file
+
+    offset is the byte offset in the CSV just past the last committed
+    record and rows the number of rows committed up to there. The sidecar
+    defaults to the CSV's name plus ".checkpoint"; one written for another
+    file_signature of the CSV, as when the file was replaced by one of the
+    same size, is refused with ValueError. replaying is True from
+    the moment a sidecar is found until the next save: the chunk after the
+    checkpoint may already be partly stored, so wrap the writer in
+    skip_replayed.
+    """
+
+    def __init__(self, filename, path=None):
+        self.filename = filename
+        self.path = path or filename + ".checkpoint"
+        self.signature = file_signature(filename)
+        self.offset = 0
+        self.rows = 0
+        self.replaying = os.path.exists(self.path)
+        if self.replaying:
+            with open(self.path, encoding="utf-8") as sidecar:
+                saved = json.load(sidecar)
+            if any(saved.get(key) != value for key, value in self.signature.items()):
+                raise ValueError(
+                    f"{self.path} was written for a different version of {filename}"
+                )
+            self.offset = saved["offset"]
+            self.rows = saved["rows"]
+
+    def save(self, offset, rows):
+        """
+        Records that the rows up to byte offset are committed
+
+        The sidecar is replaced atomically, so a crash leaves either the
+        old or the new checkpoint behind.
+        """
+        temp = self.path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as sidecar:
+            json.dump(
+                {
+                    "file": os.path.basename(self.filename),
+                    **self.signature,
+                    "offset": offset,
+                    "rows": rows,
+                },
+                sidecar,
+            )
+            sidecar.flush()
+            os.fsync(sidecar.fileno())
+        os.replace(temp, self.path)
+        self.offset = offset
+        self.rows = rows
+        self.replaying = False
+
+    def clear(self):
+        """
+        Removes the sidecar once the whole file is loaded
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def skip_replayed(write_batch, checkpoint, stored):
+    """
+    Wraps a resumable_load write_batch so rows of the replayed chunk that
+    are already stored never reach it
+
+    While checkpoint.replaying, stored(ids) returns those of the batch's
+    row IDs (the first field) already in the database and their rows are
+    dropped. Put it outside any validation.screening so the quarantine does
+    not reject them as duplicates.
+    """
+
+    def write(batch):
+        if checkpoint.replaying:
+            present = stored([row[0] for row in batch])
+            batch = [row for row in batch if row[0] not in present]
+            if not batch:
+                return True
+        return write_batch(batch)
+
+    return write
+
+
+def read_batches(csvfile, columns, stats, skip_incomplete=True):
+    """
+    Yields lists of at most stats.batch_size dicts read from an open CSV file
+
+    columns maps each CSV header to the field name used in the output dicts.
+    stats.batch_size is read on every row so callers may shrink it mid-load.
+    This is the csv.DictReader reference for load_batches, which the
+    loaders use instead.
+    """
+    reader = csv.DictReader(csvfile)
+    for key in columns:
+        if key not in (reader.fieldnames or ()):
+            raise KeyError(key)
+    batch = []
+    for row in reader:
+        if skip_incomplete and not all(row.get(key) for key in columns):
+            stats.skipped += 1
+            continue
+        batch.append({field: row[key] for key, field in columns.items()})
+        if len(batch) >= stats.batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def split_records(data, chunk_bytes=CHUNK_BYTES, start=0):
+    """
+    Yields (start, end) byte ranges of whole CSV records in data, beginning
+    at the record boundary start
+
+    The first range holds just one record, the header when start is 0; the
+    others are about chunk_bytes long. A range only ends on a newline preceded by an even
+    number of quote characters, so a quoted field spanning lines is never
+    cut in two.
+    """
+    target = start
+    while start < len(data):
+        end = data.find(b"\n", target)
+        quotes = data[start:end].count(b'"')
+        while end != -1 and quotes % 2:
+            following = data.find(b"\n", end + 1)
+            quotes += data[end:following].count(b'"')
+            end = following
+        end = len(data) if end == -1 else end + 1
+        yield start, end
+        start = end
+        target = start + chunk_bytes
+
+
+def record_ranges(filename, chunk_bytes=CHUNK_BYTES):
+    """
+    Returns the split_records ranges of filename as a list
+    """
+    with open(filename, "rb") as binary:
+        if not binary.seek(0, 2):
+            return []
+        with mmap.mmap(binary.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return list(split_records(data, chunk_bytes))
+
+
+def column_indexes(filename, columns):
+    """
+    Positions of the columns' headers in the first record of filename
+    """
+    with open(filename, encoding="utf-8", newline="") as csvfile:
+        header = next(csv.reader(csvfile), [])
+    positions = {name: i for i, name in enumerate(header)}
+    for key in columns:
+        if key not in positions:
+            raise KeyError(key)
+    return [positions[key] for key in columns]
+
+
+def parse_records(text, indexes, skip_incomplete=True):
+    """
+    Parses the whole CSV records in text into tuples of the values at indexes
+
+    Values missing from a short record are None, as csv.DictReader reports
+    them, and blank lines are dropped like DictReader does. Returns
+    (rows, skipped).
+    """
+    if len(indexes) > 1:
+        pick = itemgetter(*indexes)
+    else:
+        # itemgetter with one index returns the value rather than a tuple
+        def pick(record):
+            return (record[indexes[0]],)
+
+    width = max(indexes) + 1
+    rows = []
+    skipped = 0
+    for record in csv.reader(io.StringIO(text, newline="")):
+        if len(record) >= width:
+            row = pick(record)
+        elif record:
+            row = tuple(record[i] if i < len(record) else None for i in indexes)
+        else:
+            continue
+        if skip_incomplete and not all(row):
+            skipped += 1
+            continue
+        rows.append(row)
+    return rows, skipped
+
+
+def parse_range(filename, start, end, indexes, skip_incomplete=True):
+    """
+    Runs parse_records over bytes start:end of filename in a worker process
+    """
+    with open(filename, "rb") as binary:
+        binary.seek(start)
+        return parse_records(binary.read(end - start).decode("utf-8"), indexes,
+                             skip_incomplete)
+
+
+def map_ranges(filename, columns, skip_incomplete=True, chunk_bytes=READ_CHUNK_BYTES,
+               stats=None, start=0):
+    """
+    Yields (rows, end) for each chunk_bytes range of records in filename
+
+    rows holds a tuple of the columns' values per record and end is the
+    byte offset just past the range. The file is memory-mapped and decoded
+    one range at a time, so no per-row dicts or line objects are built.
+    Reading begins at byte offset start, which must be 0 or an end yielded
+    earlier.
+    """
+    indexes = column_indexes(filename, columns)
+    with open(filename, "rb") as binary:
+        if not binary.seek(0, 2):
+            return
+        with mmap.mmap(binary.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            ranges = split_records(data, chunk_bytes, start)
+            if not start:
+                next(ranges)
+            for begin, end in ranges:
+                rows, skipped = parse_records(data[begin:end].decode("utf-8"), indexes,
+                                              skip_incomplete)
+                if stats is not None:
+                    stats.skipped += skipped
+                yield rows, end
+
+
+def map_rows(filename, columns, skip_incomplete=True, chunk_bytes=READ_CHUNK_BYTES,
+             stats=None):
+    """
+    Yields a tuple of the columns' values for every record of filename
+    """
+    for rows, _ in map_ranges(filename, columns, skip_incomplete, chunk_bytes, stats):
+        yield from rows
+
+
+def parse_parallel(filename, columns, processes, skip_incomplete=True,
+                   chunk_bytes=CHUNK_BYTES, stats=None):
+    """
+    Yields the same tuples as map_rows, parsed by a pool of processes
+
+    At most two ranges per process are parsed ahead of the caller and rows
+    come out in file order.
+    """
+    indexes = column_indexes(filename, columns)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        try:
+            for start, end in record_ranges(filename, chunk_bytes)[1:]:
+                pending.append(pool.submit(parse_range, filename, start, end, indexes,
+                                           skip_incomplete))
+                while len(pending) >= processes * 2 or (pending and pending[0].done()):
+                    rows, skipped = pending.popleft().result()
+                    if stats is not None:
+                        stats.skipped += skipped
+                    yield from rows
+            while pending:
+                rows, skipped = pending.popleft().result()
+                if stats is not None:
+                    stats.skipped += skipped
+                yield from rows
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def load_batches(filename, columns, stats, skip_incomplete=True, processes=None):
+    """
+    Yields lists of at most stats.batch_size row tuples from filename
+
+    Each tuple holds the values of the columns' headers in order, matching
+    the field names in columns.values(). The file is parsed on this thread
+    with map_rows or, when processes is set, by that many worker processes.
+    """
+    if processes:
+        rows = parse_parallel(filename, columns, processes, skip_incomplete, stats=stats)
+    else:
+        rows = map_rows(filename, columns, skip_incomplete, stats=stats)
+    yield from group_rows(rows, stats)
+
+
+def group_rows(rows, stats):
+    """
+    Yields lists of at most stats.batch_size tuples from rows
+
+    stats.batch_size is read on every row so callers may shrink it mid-load.
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= stats.batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_load(filename, columns, write_batch, batch_size=100,
+                max_memory_mb=None, skip_incomplete=True, stats=None, processes=None):
+    """
+    Reads filename batch by batch and hands each batch, a list of row
+    tuples as yielded by load_batches, to write_batch
+
+    write_batch returns False to abort the load. When max_memory_mb is set,
+    the batch size is halved whenever the load's memory reaches a new high
+    above the ceiling (see MemoryWatch).
+    Set processes to parse the file in that many worker processes. Returns
+    False if a batch was rejected, True otherwise.
+    """
+    watch = max_memory_mb is not None or stats is not None
+    if stats is None:
+        stats = LoadStats()
+    stats.batch_size = batch_size
+    watch = MemoryWatch(stats, max_memory_mb) if watch else None
+    start = time.perf_counter()
+    try:
+        for batch in load_batches(filename, columns, stats, skip_incomplete, processes):
+            if not write_batch(batch):
+                return False
+            stats.handed += len(batch)
+            stats.batches += 1
+            if watch is not None:
+                watch.sample()
+        return True
+    finally:
+        stats.elapsed = time.perf_counter() - start
+
+
+def resumable_load(filename, columns, write_batch, checkpoint, batch_size=100,
+                   chunk_rows=None, transaction=nullcontext,
+                   max_memory_mb=None, skip_incomplete=True, stats=None):
+    """
+    Loads filename like stream_load, committing roughly every chunk_rows
+    rows (CHECKPOINT_ROWS by default) and saving checkpoint after each commit
+
+    The batches of a chunk are written inside transaction(), a context
+    manager factory such as Database.atomic; chunks end on a
+    READ_CHUNK_BYTES range boundary. Loading starts at checkpoint.offset,
+    so a rerun after a failure skips the chunks already committed; until
+    the first chunk commits there is no sidecar and a rerun starts over.
+    The checkpoint is cleared once the whole file is loaded. max_memory_mb
+    works as in stream_load. Returns False if a batch was rejected, True
+    otherwise.
+    """
+    if chunk_rows is None:
+        chunk_rows = CHECKPOINT_ROWS
+    watch = max_memory_mb is not None or stats is not None
+    if stats is None:
+        stats = LoadStats()
+    stats.batch_size = batch_size
+    watch = MemoryWatch(stats, max_memory_mb) if watch else None
+    ranges = map_ranges(filename, columns, skip_incomplete, stats=stats,
+                        start=checkpoint.offset)
+    end = checkpoint.offset
+    exhausted = False
+
+    def chunk():
+        nonlocal end, exhausted
+        count = 0
+        for rows, end in ranges:
+            yield from rows
+            count += len(rows)
+            if count >= chunk_rows:
+                return
+        exhausted = True
+
+    start = time.perf_counter()
+    try:
+        while not exhausted:
+            written = 0
+            with transaction():
+                for batch in group_rows(chunk(), stats):
+                    if not write_batch(batch):
+                        return False
+                    written += len(batch)
+                    stats.handed += len(batch)
+                    stats.batches += 1
+                    if watch is not None:
+                        watch.sample()
+            checkpoint.save(end, checkpoint.rows + written)
+        checkpoint.clear()
+        return True
+    finally:
+        stats.elapsed = time.perf_counter() - start
+
@@ -1,89 +1,227 @@
 """
 Main driver for a simple social network project
+
+peewee, loguru, the CSV loader and the modules built on them are
+imported on first use, so importing this module (and menu) stays cheap.
+The schema is created by init_database, which every function needing the
+database calls first.
 """
 
-import csv
+# pylint: disable=import-outside-toplevel
+
+from functools import partial
+
+USER_COLUMNS = {
+    "USER_ID": "user_id",
+    "EMAIL": "user_email",
+    "NAME": "user_name",
+    "LASTNAME": "user_last_name",
+}
+STATUS_COLUMNS = {
+    "STATUS_ID": "status_id",
+    "USER_ID": "user_id",
+    "STATUS_TEXT": "status_text",
+}
 
-from peewee import chunked
 
-import users
-import user_status
-from socialnetwork_model import db, StatusModel, UserModel
+def init_database(path=None):
+    """
+    Creates the schema in the SQLite database at path, once per file, and
+    returns the socialnetwork_model module
+
+    path defaults to the file already in use, initially
+    socialnetwork_model.DATABASE_PATH.
+    """
+    import socialnetwork_model
+
+    socialnetwork_model.bootstrap(path)
+    return socialnetwork_model
 
 
 # pylint: disable = E1120
-def init_user_collection():
+def init_user_collection(cache=None):
     """
     Creates and returns a new instance of UserCollection
+
+    cache is an optional cache.LRUCache; share it with the status collection
+    so that deleting a user also evicts the statuses it cascades to.
     """
-    return users.UserCollection(db)
+    model = init_database()
+    import users
+
+    return users.UserCollection(model.db, cache)
 
 
-def init_status_collection():
+def init_status_collection(cache=None):
     """
     Creates and returns a new instance of UserStatusCollection
     """
-    return user_status.UserStatusCollection(db)
+    model = init_database()
+    import user_status
+
+    return user_status.UserStatusCollection(model.db, cache)
+
+
+def init_write_behind(status_collection, **options):
+    """
+    Returns a write_behind.WriteBehind queueing add_status calls for
+    status_collection
+
+    Each flush goes through add_statuses in a single transaction, so a
+    batch costs one commit. options are passed on to WriteBehind.
+    """
+    model = init_database()
+    import write_behind
+
+    return write_behind.WriteBehind(
+        status_collection.add_statuses,
+        transaction=model.db.atomic,
+        cleanup=model.db.close,
+        **options,
+    )
 
 
-def load_users(filename):
+def load_users(filename, bulk=False, reject_file=None, stats=None):
     """
     Opens a CSV file with user data and adds it to an existing instance of UserCollection
+
+    With bulk=True the import runs in socialnetwork_model.bulk_load_mode
+    using batches sized to SQLite's bound-variable limit. Files whose
+    columns are not in header order are detected and read correctly. With
+    reject_file set, rows that fail validation are quarantined there with
+    their reasons instead of being skipped or failing the load, so the load
+    returns True even when every row is rejected; stats.rows counts the
+    users written and stats.rejected the ones quarantined.
     """
+    model = init_database()
+    import ingest
+    import validation
+
+    batch_size = model.bulk_batch_size(model.UserModel) if bulk else 100
+    if stats is None and reject_file is not None:
+        # The quarantine counts the rows it rejects in stats
+        stats = ingest.LoadStats()
+
+    def write_batch(batch):
+        model.UserModel.insert_many(batch, fields=model.USER_FIELDS).execute()
+        return True
+
     try:
-        with open(filename, encoding="utf-8", newline="") as csvfile:
-            reader = csv.DictReader(csvfile)
-            user_data = [
-                {
-                    "user_id": row["USER_ID"],
-                    "user_email": row["EMAIL"],
-                    "user_name": row["NAME"],
-                    "user_last_name": row["LASTNAME"],
-                }
-                for row in reader
-                if all(
-                    key in row and row[key]
-                    for key in ["USER_ID", "EMAIL", "NAME", "LASTNAME"]
-                )
-            ]
-            if user_data:
-                with db.atomic():  # Use transactions
-                    for batch in chunked(
-                        user_data, 100
-                    ):  # Adjust the batch size as needed
-                        UserModel.insert_many(batch).execute()
-            return True
+        layout = validation.detect_layout(filename, USER_COLUMNS)
+        with validation.quarantine(
+            reject_file,
+            USER_COLUMNS,
+            stats,
+            id_exists=partial(model.existing_values, model.UserModel.user_id),
+        ) as screen, (
+            model.bulk_load_mode(models=(model.UserModel,))
+            if bulk
+            else model.db.atomic()
+        ):
+            return ingest.stream_load(
+                filename,
+                USER_COLUMNS,
+                validation.screening(write_batch, screen, layout),
+                batch_size=batch_size,
+                skip_incomplete=reject_file is None,
+                stats=stats,
+            )
     except (FileNotFoundError, KeyError):
         return False
 
 
-def load_status_updates(filename):
+def load_status_updates(
+    filename,
+    batch_size=None,
+    max_memory_mb=None,
+    stats=None,
+    bulk=False,
+    processes=None,
+    reject_file=None,
+    checkpoint_file=None,
+):
     """
-    Opens a CSV file with status data and adds it to an existing instance of UserStatusCollection
-    or directly to the database using insert_many.
+    Streams a CSV file with status data into the database using insert_many.
+
+    Only one batch of rows is held in memory at a time. Pass an
+    ingest.LoadStats instance as stats to collect rows/sec and peak memory.
+    With bulk=True the import runs in socialnetwork_model.bulk_load_mode and
+    batch_size defaults to the largest batch SQLite accepts. Set processes
+    to parse the CSV in that many worker processes. With reject_file set,
+    rows that fail validation, repeat a status ID or belong to an unknown
+    user are quarantined there instead of failing the load.
+
+    With checkpoint_file set the import commits every
+    ingest.CHECKPOINT_ROWS rows instead of in one transaction and records
+    its progress in that file; calling it again after a failure resumes
+    from the last commit. Checkpointed imports cannot be combined with
+    bulk or processes.
     """
+    if checkpoint_file is not None and (bulk or processes):
+        raise ValueError("checkpointed imports cannot use bulk or processes")
+    model = init_database()
+    import ingest
+    import validation
+
+    if batch_size is None:
+        batch_size = model.bulk_batch_size(model.StatusModel) if bulk else 100
+    if stats is None and reject_file is not None:
+        stats = ingest.LoadStats()
+    checkpoint = None
+
+    def write_batch(batch):
+        model.StatusModel.insert_many(
+            model.resolve_user_refs(batch), fields=model.STATUS_FIELDS
+        ).execute()
+        return True
+
     try:
-        with open(filename, encoding="utf-8", newline="") as csvfile:
-            reader = csv.DictReader(csvfile)
-            status_data = [
-                {
-                    "status_id": row["STATUS_ID"],
-                    "user_id": row["USER_ID"],
-                    "status_text": row["STATUS_TEXT"],
-                }
-                for row in reader
-                if all(
-                    key in row and row[key]
-                    for key in ["STATUS_ID", "USER_ID", "STATUS_TEXT"]
+        if checkpoint_file is not None:
+            checkpoint = ingest.Checkpoint(filename, checkpoint_file)
+        with validation.quarantine(
+            reject_file,
+            STATUS_COLUMNS,
+            stats,
+            id_exists=partial(model.existing_values, model.StatusModel.status_id),
+            user_exists=partial(model.existing_values, model.UserModel.user_id),
+            append=checkpoint is not None and checkpoint.replaying,
+        ) as screen:
+            write = validation.screening(write_batch, screen)
+            if checkpoint is not None:
+                # Part of the first chunk may have been stored before the
+                # failure; only those status IDs are skipped, so rows failing
+                # NOT NULL, such as unknown users in the compact layout,
+                # still fail the load.
+                return ingest.resumable_load(
+                    filename,
+                    STATUS_COLUMNS,
+                    ingest.skip_replayed(
+                        write,
+                        checkpoint,
+                        partial(model.existing_values, model.StatusModel.status_id),
+                    ),
+                    checkpoint,
+                    batch_size=batch_size,
+                    transaction=model.db.atomic,
+                    max_memory_mb=max_memory_mb,
+                    skip_incomplete=reject_file is None,
+                    stats=stats,
+                )
+            with (
+                model.bulk_load_mode(models=(model.StatusModel,))
+                if bulk
+                else model.db.atomic()
+            ):
+                return ingest.stream_load(
+                    filename,
+                    STATUS_COLUMNS,
+                    write,
+                    batch_size=batch_size,
+                    max_memory_mb=max_memory_mb,
+                    skip_incomplete=reject_file is None,
+                    stats=stats,
+                    processes=processes,
                 )
-            ]
-            if status_data:
-                with db.atomic():  # Use transactions
-                    for batch in chunked(
-                        status_data, 100
-                    ):  # Adjust the batch size as needed
-                        StatusModel.insert_many(batch).execute()
-            return True
     except (FileNotFoundError, KeyError):
         return False
 
@@ -116,6 +254,14 @@ def search_user(user_id, user_collection):
     return user_collection.search_user(user_id)
 
 
+def search_users(user_ids, user_collection):
+    """
+    Searches for many users at once, such as the authors of a page of
+    statuses; returns a dict of the users found keyed by user ID
+    """
+    return user_collection.search_users(user_ids)
+
+
 def add_status(user_id, status_id, status_text, status_collection):
     """
     Creates a new instance of UserStatus and stores it in status_collection
@@ -141,4 +287,27 @@ def search_status(status_id, status_collection):
     """
     Searches for a status in status_collection
     """
-    return status_collection.search_status(status_id)
\ No newline at end of file
+    return status_collection.search_status(status_id)
+
+
+def search_statuses(status_ids, status_collection):
+    """
+    Searches for many statuses at once; returns a dict of the statuses
+    found keyed by status ID
+    """
+    return status_collection.search_statuses(status_ids)
+
+
+def get_user_statuses(user_id, status_collection, after=None, limit=25):
+    """
+    Yields a page of a user's statuses, latest first; see
+    UserStatusCollection.get_user_statuses for the cursor semantics
+    """
+    return status_collection.get_user_statuses(user_id, after, limit)
+
+
+def search_statuses_by_text(query, status_collection, limit=25):
+    """
+    Full-text search over status texts, best matches first
+    """
+    return status_collection.search_statuses_by_text(query, limit)
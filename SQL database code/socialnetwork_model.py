@@ -1,19 +1,114 @@
 """
 implements database as a social network model
+
+Importing this module does not touch the database file; call bootstrap()
+before first use to create the schema.
 """
 
 # pylint: disable=R0903
 
+import inspect
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+
 from peewee import (
     Model,
-    SqliteDatabase,
     CharField,
     ForeignKeyField,
+    IntegrityError,
 )
+from playhouse.pool import MaxConnectionsExceeded, PooledSqliteDatabase
+
+# Pool settings; connections idle for longer than STALE_TIMEOUT seconds are
+# recycled and callers wait up to WAIT_TIMEOUT seconds for a free connection
+POOL_SIZE = int(os.environ.get("SOCIALNETWORK_POOL_SIZE", "8"))
+STALE_TIMEOUT = 300
+WAIT_TIMEOUT = 10
+
+# Table layout. "text" keys both tables on their string IDs; "compact" gives
+# them INTEGER rowid keys, keeps the string IDs behind unique indexes and
+# stores a status' owner as an integer. A database file keeps the layout it
+# was created with.
+STORAGE_MODE = os.environ.get("SOCIALNETWORK_STORAGE", "text")
+if STORAGE_MODE not in ("text", "compact"):
+    raise ValueError(f"Unknown SOCIALNETWORK_STORAGE {STORAGE_MODE!r}")
+COMPACT = STORAGE_MODE == "compact"
+
+# Database file used until bootstrap() is given another one
+DATABASE_PATH = os.environ.get("SOCIALNETWORK_DATABASE", "database.db")
+# Connection settings; db.init() forgets any that are not passed again
+CONNECT_OPTIONS = {"pragmas": {"foreign_keys": 1}, "check_same_thread": False}
+
+
+class MonitoredPooledSqliteDatabase(PooledSqliteDatabase):
+    """
+    Pooled SQLite database that records checkout and wait metrics
+
+    Each thread gets its own connection from the pool. The collection
+    methods return theirs when they finish (see pooled); wrap any other
+    work in db.connection_context() so the connection is returned.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._waiting = threading.local()
+        super().__init__(*args, **kwargs)
+
+    def connect(self, reuse_if_open=False):
+        start = time.monotonic()
+        self._waiting.flag = False
+        try:
+            return super().connect(reuse_if_open)
+        finally:
+            if self._waiting.flag:
+                with self._pool_lock:
+                    self.waits += 1
+                    self.wait_seconds += time.monotonic() - start
+
+    def _connect(self):
+        try:
+            conn = super()._connect()
+        except MaxConnectionsExceeded:
+            self._waiting.flag = True
+            raise
+        self.checkouts += 1
+        return conn
 
+    def pool_metrics(self):
+        """
+        Returns checkout/wait counters and the current pool occupancy
+        """
+        with self._pool_lock:
+            return {
+                "max_connections": self._max_connections,
+                "in_use": len(self._in_use),
+                "idle": len(self._connections),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_seconds": self.wait_seconds,
+            }
 
-db = SqliteDatabase("database.db", pragmas={"foreign_keys": 1})
-db.connect()
+
+db = MonitoredPooledSqliteDatabase(
+    DATABASE_PATH,
+    max_connections=POOL_SIZE,
+    stale_timeout=STALE_TIMEOUT,
+    timeout=WAIT_TIMEOUT,
+    **CONNECT_OPTIONS,
+)
+
+# SQLite raised its default bound-variable limit from 999 in 3.32.0
+SQLITE_MAX_VARIABLES = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+# IDs per IN query of the search_users and search_statuses lookups, which
+# bind one variable per ID
+LOOKUP_BATCH_SIZE = SQLITE_MAX_VARIABLES
 
 
 class BaseModel(Model):
@@ -34,21 +129,322 @@ class UserModel(BaseModel):
     database for users
     """
 
-    user_id = CharField(primary_key=True, max_length=30)
+    user_id = CharField(primary_key=not COMPACT, unique=COMPACT, max_length=30)
     user_name = CharField(max_length=30)
     user_last_name = CharField(max_length=100)
     user_email = CharField()
 
+    def __str__(self):
+        return self.user_id
+
 
 class StatusModel(BaseModel):
     """
     database for statuses
     """
 
-    status_id = CharField(primary_key=True, max_length=30)
-    user_id = ForeignKeyField(UserModel, backref="statuses", on_delete="CASCADE")
+    status_id = CharField(primary_key=not COMPACT, unique=COMPACT, max_length=30)
+    # The (user_id, status_id) index below also serves lookups by user_id
+    user_id = ForeignKeyField(
+        UserModel, backref="statuses", on_delete="CASCADE", index=False
+    )
     status_text = CharField(max_length=250)
 
+    class Meta:
+        """
+        (user_id, status_id) serves the keyset-paginated user timeline
+        """
+
+        indexes = ((("user_id", "status_id"), False),)
+
+
+# Field order of the row tuples handed to insert_many
+USER_FIELDS = [
+    UserModel.user_id,
+    UserModel.user_email,
+    UserModel.user_name,
+    UserModel.user_last_name,
+]
+STATUS_FIELDS = [StatusModel.status_id, StatusModel.user_id, StatusModel.status_text]
+
+# Default fields of the rows read by search_user_row and search_status_row
+USER_ROW = ("user_id", "user_email", "user_name", "user_last_name")
+STATUS_ROW = ("status_id", "user_id", "status_text")
+
+
+# FTS5 inverted index over StatusModel.status_text, with English stemming
+# as in the MongoDB text index. It is an external content table keyed on
+# the status rowid, so the text is stored once; the triggers keep it in
+# step with every INSERT, UPDATE and DELETE, including the deletes
+# cascaded from UserModel. A VACUUM may renumber statusmodel rowids in the
+# "text" storage layout, so run rebuild_text_index() after one.
+TEXT_INDEX = "statusmodel_fts"
+TEXT_INDEX_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TEXT_INDEX} USING fts5("
+    "status_text, content='statusmodel', content_rowid='rowid', "
+    "tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS statusmodel_fts_insert AFTER INSERT ON statusmodel "
+    f"BEGIN INSERT INTO {TEXT_INDEX}(rowid, status_text) "
+    "VALUES (new.rowid, new.status_text); END",
+    "CREATE TRIGGER IF NOT EXISTS statusmodel_fts_delete AFTER DELETE ON statusmodel "
+    f"BEGIN INSERT INTO {TEXT_INDEX}({TEXT_INDEX}, rowid, status_text) "
+    "VALUES ('delete', old.rowid, old.status_text); END",
+    "CREATE TRIGGER IF NOT EXISTS statusmodel_fts_update AFTER UPDATE ON statusmodel "
+    f"BEGIN INSERT INTO {TEXT_INDEX}({TEXT_INDEX}, rowid, status_text) "
+    "VALUES ('delete', old.rowid, old.status_text); "
+    f"INSERT INTO {TEXT_INDEX}(rowid, status_text) "
+    "VALUES (new.rowid, new.status_text); END",
+)
+
+
+@contextmanager
+def borrowed_connection(database=db):
+    """
+    Connects database on the calling thread if it is closed and returns the
+    connection to the pool on exit
+
+    A connection the thread already has open, as inside a transaction, is
+    used and left open.
+    """
+    if not database.is_closed():
+        yield database
+        return
+    database.connect()
+    try:
+        yield database
+    finally:
+        database.close()
+
+
+def pooled(method):
+    """
+    Decorator running a collection method on a borrowed_connection of the
+    collection's database
+
+    Generator methods hold the connection until they are exhausted or
+    closed.
+    """
+    if inspect.isgeneratorfunction(method):
+
+        @wraps(method)
+        def generator(self, *args, **kwargs):
+            with borrowed_connection(self.database):
+                yield from method(self, *args, **kwargs)
+
+        return generator
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with borrowed_connection(self.database):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def rebuild_text_index(database=db):
+    """
+    Rebuilds the full-text index from the statusmodel table, if it exists
+    """
+    if database.table_exists(TEXT_INDEX):
+        database.execute_sql(
+            f"INSERT INTO {TEXT_INDEX}({TEXT_INDEX}) VALUES ('rebuild')"
+        )
+
+
+def create_text_index(database=db):
+    """
+    Creates the full-text index and its triggers; existing ones are kept
+    """
+    created = not database.table_exists(TEXT_INDEX)
+    for sql in TEXT_INDEX_SQL:
+        database.execute_sql(sql)
+    if created:
+        rebuild_text_index(database)
+
 
-db.create_tables([UserModel, StatusModel])
-db.close()
+def drop_text_index(database=db):
+    """
+    Drops the full-text index together with its triggers
+    """
+    for trigger in ("insert", "delete", "update"):
+        database.execute_sql(f"DROP TRIGGER IF EXISTS statusmodel_fts_{trigger}")
+    database.execute_sql(f"DROP TABLE IF EXISTS {TEXT_INDEX}")
+
+
+def existing_values(field, values):
+    """
+    Returns the subset of values present in field, using one IN query
+    """
+    query = field.model.select(field).where(field.in_(list(values)))
+    return {value for (value,) in query.tuples()}
+
+
+def user_ref(user_id):
+    """
+    Value stored in StatusModel.user_id for a string user ID
+
+    In the compact layout this is a subquery resolving the integer key.
+    """
+    if COMPACT:
+        return UserModel.select(UserModel.id).where(UserModel.user_id == user_id)
+    return user_id
+
+
+def resolve_user_refs(rows):
+    """
+    Swaps the string user ID in STATUS_FIELDS row tuples for its stored key
+
+    Returns rows unchanged in the text layout. In the compact layout the
+    keys are looked up with one IN query and new tuples are returned;
+    unknown users become None, which the NOT NULL constraint rejects on
+    insert.
+    """
+    if not COMPACT or not rows:
+        return rows
+    query = UserModel.select(UserModel.user_id, UserModel.id).where(
+        UserModel.user_id.in_({row[1] for row in rows})
+    )
+    keys = dict(query.tuples())
+    return [(status_id, keys.get(user_id), text) for status_id, user_id, text in rows]
+
+
+def select_statuses():
+    """
+    StatusModel query whose rows know their owner's string user ID
+
+    The compact layout joins in UserModel.user_id so reading it through
+    status_owner() or status.user_id costs no extra query.
+    """
+    if COMPACT:
+        return StatusModel.select(StatusModel, UserModel.id, UserModel.user_id).join(
+            UserModel
+        )
+    return StatusModel.select()
+
+
+def status_owner(status):
+    """
+    String user ID of a status read through select_statuses()
+    """
+    return status.user_id.user_id if COMPACT else status.user_id_id
+
+
+@lru_cache(maxsize=None)
+def row_class(fields):
+    """
+    namedtuple class for rows of the given field names
+
+    Built once per tuple of names; peewee's .namedtuples() builds a new
+    class for every query.
+    """
+    return namedtuple("Row", fields)
+
+
+def select_row(model, fields):
+    """
+    Query reading only the named fields of model as plain tuples
+
+    A status user_id is the string user ID in both layouts; the compact
+    layout joins in UserModel for it.
+    """
+    if COMPACT and model is StatusModel and "user_id" in fields:
+        columns = [
+            UserModel.user_id if name == "user_id" else getattr(model, name)
+            for name in fields
+        ]
+        return model.select(*columns).join(UserModel).tuples()
+    return model.select(*[getattr(model, name) for name in fields]).tuples()
+
+
+# Database files whose schema bootstrap() has already set up
+_bootstrapped = set()
+_bootstrap_lock = threading.Lock()
+
+
+def bootstrap(path=None, database=db):
+    """
+    Creates the tables and full-text index and checks the storage layout,
+    once per database file
+
+    path points database at another file first. Later calls for a file
+    that is already set up return straight away. Returns database.
+    """
+    with _bootstrap_lock:
+        if path is not None and path != database.database:
+            database.close_all()
+            database.init(path, **CONNECT_OPTIONS)
+        if database.database in _bootstrapped:
+            return database
+        opened = database.is_closed()
+        if opened:
+            database.connect()
+        try:
+            database.create_tables([UserModel, StatusModel])
+            columns = {column.name for column in database.get_columns("usermodel")}
+            if COMPACT != ("id" in columns):
+                raise ValueError(
+                    f"{database.database} was not created with the "
+                    f"{STORAGE_MODE} storage layout"
+                )
+            # Files created before the foreign key lost its own index
+            database.execute_sql('DROP INDEX IF EXISTS "statusmodel_user_id"')
+            create_text_index(database)
+        finally:
+            if opened:
+                database.close()
+        _bootstrapped.add(database.database)
+    return database
+
+
+def bulk_batch_size(model):
+    """
+    Largest insert_many batch for model that stays under the variable limit
+    """
+    return SQLITE_MAX_VARIABLES // len(model._meta.sorted_fields)
+
+
+@contextmanager
+def bulk_load_mode(database=db, models=(UserModel, StatusModel)):
+    """
+    Tunes the connection for a large import and restores it afterwards
+
+    While active the database uses WAL journaling with synchronous off, a
+    256 MiB page cache and no per-row foreign key enforcement. Secondary
+    indexes and triggers on models are dropped and rebuilt once the load is
+    done, the full-text index being rebuilt in one pass rather than row by
+    row, and foreign keys are checked a single time before the import
+    commits; any violation raises IntegrityError and rolls the whole import back.
+    Must not be entered from inside an open transaction.
+    """
+    saved = {
+        name: database.pragma(name)
+        for name in ("journal_mode", "synchronous", "cache_size", "foreign_keys")
+    }
+    database.pragma("journal_mode", "wal")
+    database.pragma("synchronous", "off")
+    database.pragma("cache_size", -256 * 1024)
+    database.pragma("foreign_keys", 0)
+    try:
+        with database.atomic():
+            schema = database.execute_sql(
+                "SELECT type, name, sql FROM sqlite_master "
+                "WHERE type IN ('index', 'trigger') "
+                "AND sql IS NOT NULL AND tbl_name IN (%s)"
+                % ", ".join("?" for _ in models),
+                [model._meta.table_name for model in models],
+            ).fetchall()
+            for kind, name, _ in schema:
+                database.execute_sql(f'DROP {kind.upper()} "{name}"')
+            yield database
+            for _, _, sql in schema:
+                database.execute_sql(sql)
+            if any(kind == "trigger" for kind, _, _ in schema):
+                rebuild_text_index(database)
+            violations = database.execute_sql("PRAGMA foreign_key_check").fetchall()
+            if violations:
+                raise IntegrityError(
+                    f"{len(violations)} rows violate foreign key constraints"
+                )
+    finally:
+        for name, value in saved.items():
+            database.pragma(name, value)
@@ -0,0 +1,45 @@
+"""
+Tests that the collections return their pooled connections
+"""
+
+import threading
+
+import main
+import socialnetwork_model
+
+
+def test_short_lived_threads_do_not_exhaust_the_pool(tmp_path, monkeypatch):
+    # Importing users starts its log file in the working directory
+    monkeypatch.chdir(tmp_path)
+    model = main.init_database(str(tmp_path / "socialnetwork.db"))
+    users = main.init_user_collection()
+    statuses = main.init_status_collection()
+    errors = []
+
+    def work(i):
+        try:
+            assert users.add_user(f"user{i}", f"user{i}@uw.edu", "User", f"Name{i}")
+            assert users.search_user(f"user{i}")
+            assert statuses.add_status(f"status{i}", f"user{i}", "text")
+            assert len(list(statuses.get_user_statuses(f"user{i}"))) == 1
+        except Exception as error:  # pylint: disable=broad-except
+            errors.append(error)
+
+    model.db.close()
+    for i in range(2 * socialnetwork_model.POOL_SIZE):
+        thread = threading.Thread(target=work, args=(i,))
+        thread.start()
+        thread.join()
+    assert not errors
+    assert model.db.pool_metrics()["in_use"] == 0
+
+
+def test_transaction_keeps_its_connection(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    model = main.init_database(str(tmp_path / "socialnetwork.db"))
+    users = main.init_user_collection()
+    with model.db.atomic():
+        assert users.add_user("user", "user@uw.edu", "User", "Name")
+        assert not model.db.is_closed()
+        assert users.search_user("user")
+    assert users.search_user("user").user_email == "user@uw.edu"
@@ -0,0 +1,33 @@
+"""
+Tests for loads that quarantine rejected rows
+"""
+
+import csv
+
+import ingest
+import main
+
+USERS = 50
+
+
+def test_reload_counts_rejects_apart_from_written_rows(tmp_path):
+    model = main.init_database(str(tmp_path / "socialnetwork.db"))
+    accounts = tmp_path / "accounts.csv"
+    with open(accounts, "w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(main.USER_COLUMNS)
+        for i in range(USERS):
+            writer.writerow([f"user{i}", f"user{i}@uw.edu", "User", f"Name{i}"])
+    reject_file = str(tmp_path / "rejects.csv")
+
+    first = ingest.LoadStats()
+    assert main.load_users(str(accounts), reject_file=reject_file, stats=first)
+    assert (first.rows, first.rejected) == (USERS, 0)
+
+    again = ingest.LoadStats()
+    assert main.load_users(str(accounts), reject_file=reject_file, stats=again)
+    assert (again.rows, again.rejected) == (0, USERS)
+    assert again.reasons == {"duplicate USER_ID": USERS}
+    assert again.rows_per_sec == 0
+    assert again.reject_rate == 1
+    assert model.UserModel.select().count() == USERS
@@ -0,0 +1,79 @@
+"""
+Tests for resuming a checkpointed status load after a crash
+"""
+
+import csv
+
+import pytest
+
+import ingest
+import main
+
+USERS = 20
+# Checkpoint interval used by the tests, which keeps the status file small
+CHUNK_ROWS = 1000
+STATUSES = 5 * CHUNK_ROWS
+
+
+class Crash(Exception):
+    """
+    Stands in for the process being killed
+    """
+
+
+@pytest.fixture(name="files")
+def fixture_files(tmp_path):
+    model = main.init_database(str(tmp_path / "socialnetwork.db"))
+    model.StatusModel.delete().execute()
+    model.UserModel.delete().execute()
+    accounts = tmp_path / "accounts.csv"
+    with open(accounts, "w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(main.USER_COLUMNS)
+        for i in range(USERS):
+            writer.writerow([f"user{i}", f"user{i}@uw.edu", "User", f"Name{i}"])
+    status_updates = tmp_path / "status_updates.csv"
+    with open(status_updates, "w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(main.STATUS_COLUMNS)
+        for i in range(STATUSES):
+            writer.writerow([f"user{i % USERS}_{i:07d}", f"user{i % USERS}", f"status {i}"])
+    assert main.load_users(str(accounts))
+    return model, str(status_updates), str(tmp_path / "rejects.csv")
+
+
+def test_resume_with_reject_file_rejects_nothing(files, monkeypatch):
+    model, status_updates, reject_file = files
+    checkpoint_file = status_updates + ".checkpoint"
+    save = ingest.Checkpoint.save
+    saves = []
+
+    def crash_on_second_save(checkpoint, offset, rows):
+        # The second chunk is committed but its checkpoint is never written,
+        # so the resumed load replays a chunk that is already stored
+        saves.append(offset)
+        if len(saves) == 2:
+            raise Crash
+        save(checkpoint, offset, rows)
+
+    monkeypatch.setattr(ingest, "CHECKPOINT_ROWS", CHUNK_ROWS)
+    monkeypatch.setattr(ingest.Checkpoint, "save", crash_on_second_save)
+    with pytest.raises(Crash):
+        main.load_status_updates(
+            status_updates, reject_file=reject_file, checkpoint_file=checkpoint_file
+        )
+    monkeypatch.setattr(ingest.Checkpoint, "save", save)
+    assert model.StatusModel.select().count() > CHUNK_ROWS
+
+    stats = ingest.LoadStats()
+    assert main.load_status_updates(
+        status_updates,
+        reject_file=reject_file,
+        checkpoint_file=checkpoint_file,
+        stats=stats,
+    )
+    assert stats.rejected == 0
+    assert not stats.reasons
+    with open(reject_file, encoding="utf-8", newline="") as csv_file:
+        assert list(csv.reader(csv_file)) == [list(main.STATUS_COLUMNS) + ["REASONS"]]
+    assert model.StatusModel.select().count() == STATUSES
@@ -2,9 +2,27 @@
 classes to manage the user status messages
 """
 
-from peewee import IntegrityError, DoesNotExist
+from peewee import Column, DoesNotExist, Expression, IntegrityError, Table, chunked
 from loguru import logger
-from socialnetwork_model import StatusModel
+from socialnetwork_model import (
+    LOOKUP_BATCH_SIZE,
+    STATUS_FIELDS,
+    STATUS_ROW,
+    StatusModel,
+    UserModel,
+    TEXT_INDEX,
+    existing_values,
+    pooled,
+    resolve_user_refs,
+    row_class,
+    select_row,
+    select_statuses,
+    user_ref,
+)
+
+# Items per transaction in the bulk methods; IN lists stay under SQLite's
+# oldest bound-variable limit of 999
+BATCH_SIZE = 200
 
 
 # set-up logging for user_status.py
@@ -18,71 +36,283 @@ class UserStatusCollection:
     Collection of UserStatus messages
     """
 
-    def __init__(self, database):
+    def __init__(self, database, cache=None):
         self.database = database
+        self.cache = cache
         logger.debug("user database created and linked")
 
+    def _invalidate(self, status_id):
+        """
+        Drops a status from the cache
+        """
+        if self.cache is not None:
+            self.cache.invalidate(("status", status_id))
+
+    @pooled
     def add_status(self, status_id, user_id, status_text):
         """
         add a new status message to the collection
         """
         try:
-            with self.database.transaction():
-                result = StatusModel.create(
-                    status_id=status_id, user_id=user_id, status_text=status_text
-                )
-                result.save()
-                # logger.debug("Status ID %s successfully added", status_id)
-                return True
+            StatusModel.insert(
+                status_id=status_id, user_id=user_ref(user_id), status_text=status_text
+            ).execute()
+            # logger.debug("Status ID {} successfully added", status_id)
+            self._invalidate(status_id)
+            return True
         except IntegrityError:
-            # logger.debug("Status ID %s cannot be added", status_id)
+            # logger.debug("Status ID {} cannot be added", status_id)
             return False
 
+    @pooled
     def modify_status(self, status_id, user_id, status_text):
         """
-        Modifies a status message
+        Modifies a status message with a single UPDATE
         """
+        query = StatusModel.update(
+            user_id=user_ref(user_id), status_text=status_text
+        ).where(StatusModel.status_id == status_id)
         try:
-            with self.database.transaction():
-                result = self.search_status(status_id)
-                if result:
-                    result.user_id = user_id
-                    result.status_text = status_text
-                    result.save()
-                    logger.info("Status ID %s successfully modified", status_id)
-                    return True
-                logger.info(
-                    "Status ID %s cannot be deleted as it does not exist", status_id
-                )
-                return False
+            if query.execute():
+                self._invalidate(status_id)
+                logger.info("Status ID {} successfully modified", status_id)
+                return True
+            logger.info("Status ID {} cannot be modified as it does not exist", status_id)
+            return False
         except IntegrityError:
-            logger.debug("User ID %s status cannot be modified", user_id)
+            logger.debug("User ID {} status cannot be modified", user_id)
             return False
 
+    @pooled
+    def modify_own_status(self, status_id, user_id, status_text):
+        """
+        Modifies the text of a status message only if user_id owns it, with
+        a single UPDATE
+        """
+        query = StatusModel.update(status_text=status_text).where(
+            (StatusModel.status_id == status_id)
+            & (StatusModel.user_id == user_ref(user_id))
+        )
+        if query.execute():
+            self._invalidate(status_id)
+            logger.info("Status ID {} successfully modified", status_id)
+            return True
+        logger.info("Status ID {} of user ID {} does not exist", status_id, user_id)
+        return False
+
+    @pooled
     def delete_status(self, status_id):
         """
-        deletes the status message with id, status_id
+        deletes the status message with id, status_id, with a single DELETE
+        """
+        if StatusModel.delete().where(StatusModel.status_id == status_id).execute():
+            self._invalidate(status_id)
+            logger.info("Status ID {} successfully deleted", status_id)
+            return True
+        logger.debug("Status ID {} does not exist", status_id)
+        return False
+
+    @pooled
+    def add_statuses(self, statuses):
+        """
+        Adds many status messages, one transaction per chunk
+
+        statuses is an iterable of (status_id, user_id, status_text) tuples.
+        Returns a list of booleans in input order; an item is False when its
+        status ID already exists or repeats an earlier item, or when its
+        user does not exist.
+        """
+        results = []
+        for chunk in chunked(statuses, BATCH_SIZE):
+            with self.database.transaction():
+                seen = existing_values(StatusModel.status_id, [row[0] for row in chunk])
+                known_users = existing_values(UserModel.user_id, {row[1] for row in chunk})
+                rows = []
+                for row in chunk:
+                    added = row[0] not in seen and row[1] in known_users
+                    results.append(added)
+                    if added:
+                        seen.add(row[0])
+                        rows.append(tuple(row))
+                if rows:
+                    StatusModel.insert_many(
+                        resolve_user_refs(rows), fields=STATUS_FIELDS
+                    ).execute()
+            for row in rows:
+                self._invalidate(row[0])
+        logger.debug("Bulk added {} of {} statuses", sum(results), len(results))
+        return results
+
+    @pooled
+    def modify_statuses(self, statuses):
+        """
+        Modifies many status messages, one transaction per chunk
+
+        statuses is an iterable of (status_id, user_id, status_text) tuples.
+        Returns a list of booleans in input order; an item is False when its
+        status ID or its user does not exist.
+        """
+        results = []
+        for chunk in chunked(statuses, BATCH_SIZE):
+            with self.database.transaction():
+                known_users = existing_values(UserModel.user_id, {row[1] for row in chunk})
+                for status_id, user_id, status_text in chunk:
+                    if user_id not in known_users:
+                        results.append(False)
+                        continue
+                    query = StatusModel.update(
+                        user_id=user_ref(user_id), status_text=status_text
+                    ).where(StatusModel.status_id == status_id)
+                    results.append(query.execute() > 0)
+            for row in chunk:
+                self._invalidate(row[0])
+        logger.debug("Bulk modified {} of {} statuses", sum(results), len(results))
+        return results
+
+    @pooled
+    def delete_statuses(self, status_ids):
+        """
+        Deletes many status messages, one transaction per chunk
+
+        Returns a list of booleans in input order; an item is False when the
+        status ID does not exist or was already deleted earlier in the call.
+        """
+        results = []
+        for chunk in chunked(status_ids, BATCH_SIZE):
+            with self.database.transaction():
+                found = existing_values(StatusModel.status_id, chunk)
+                if found:
+                    StatusModel.delete().where(
+                        StatusModel.status_id.in_(list(found))
+                    ).execute()
+            for status_id in chunk:
+                results.append(status_id in found)
+                found.discard(status_id)
+                self._invalidate(status_id)
+        logger.debug("Bulk deleted {} of {} statuses", sum(results), len(results))
+        return results
+
+    def search_statuses(self, status_ids):
+        """
+        Searches for many status messages in one transaction
+
+        IDs not served by the cache are read with one IN query per
+        LOOKUP_BATCH_SIZE of them. Returns a dict mapping each status ID
+        that was found to its StatusModel; IDs that do not exist are left
+        out.
         """
+        if self.cache is None:
+            return self._search_statuses(list(dict.fromkeys(status_ids)))
+        return self.cache.get_or_load_many("status", status_ids, self._search_statuses)
+
+    @pooled
+    def _search_statuses(self, status_ids):
+        """
+        Reads a list of distinct status messages from the database
+        """
+        found = {}
         with self.database.transaction():
-            result = self.search_status(status_id)
-            if result:
-                result.delete_instance()
-                logger.info("Status ID %s successfully deleted", status_id)
-                return True
-            logger.debug("Status ID %s does not exist", status_id)
-            return False
+            # Sliced rather than chunked(), which pads every chunk to size
+            for start in range(0, len(status_ids), LOOKUP_BATCH_SIZE):
+                chunk = status_ids[start : start + LOOKUP_BATCH_SIZE]
+                query = select_statuses().where(StatusModel.status_id.in_(chunk))
+                for status in query:
+                    found[status.status_id] = status
+        return found
+
+    @pooled
+    def get_user_statuses(self, user_id, after=None, limit=25):
+        """
+        Yields up to limit statuses of user_id, latest first
+
+        Statuses are ordered by descending status_id, the only ordering the
+        data carries. Pass the status_id of the last status of a page as
+        after to fetch the next page; the (user_id, status_id) index makes
+        every page an index range scan instead of an OFFSET skip.
+        """
+        query = select_statuses().where(StatusModel.user_id == user_ref(user_id))
+        if after is not None:
+            query = query.where(StatusModel.status_id < after)
+        query = query.order_by(StatusModel.status_id.desc()).limit(limit)
+        yield from query.iterator()
+
+    @pooled
+    def search_statuses_by_text(self, query, limit=25):
+        """
+        Returns up to limit statuses matching any word of query, best first
+
+        Words are stemmed and matched through the FTS5 index and ranked by
+        bm25; FTS5 query syntax in query is treated as plain text.
+        """
+        terms = " OR ".join(
+            '"{}"'.format(word.replace('"', '""')) for word in query.split()
+        )
+        if not terms:
+            return []
+        text_index = Table(TEXT_INDEX, ("rowid", "status_text", "rank"))
+        query = (
+            select_statuses()
+            .join_from(
+                StatusModel,
+                text_index,
+                on=(text_index.rowid == Column(StatusModel, "rowid")),
+            )
+            .where(Expression(text_index.status_text, "MATCH", terms))
+            .order_by(text_index.rank)
+            .limit(limit)
+        )
+        return list(query)
 
     def search_status(self, status_id):
         """
         Find and return a status message by its status_id
 
-        Returns an empty UserStatus object if status_id does not exist
+        Returns an empty UserStatus object if status_id does not exist.
+        Served from the cache when one was given to the collection.
+        """
+        if self.cache is None:
+            return self._search_status(status_id)
+        return self.cache.get_or_load(
+            ("status", status_id), self._search_status, status_id
+        )
+
+    @pooled
+    def _search_status(self, status_id):
+        """
+        Reads a status message from the database
         """
         try:
             with self.database.transaction():
-                result = StatusModel.get(StatusModel.status_id == status_id)
-                logger.info("Status ID %s successfully found", status_id)
+                result = (
+                    select_statuses().where(StatusModel.status_id == status_id).get()
+                )
+                logger.debug("Status ID {} successfully found", status_id)
                 return result
         except DoesNotExist:
-            logger.debug("Status ID %s cannot be found", status_id)
+            logger.debug("Status ID {} cannot be found", status_id)
+            return False
+
+    @pooled
+    def search_status_row(self, status_id, fields=STATUS_ROW):
+        """
+        Reads only the named StatusModel fields of a status, as a namedtuple
+
+        user_id is the owner's string user ID. One SELECT of those columns,
+        with no model instance, transaction or cache; returns False if
+        status_id does not exist.
+        """
+        fields = tuple(fields)
+        query = select_row(StatusModel, fields).where(
+            StatusModel.status_id == status_id
+        )
+        row = query.first()
+        if row is None:
             return False
+        return row_class(fields)(*row)
+
+    @pooled
+    def exists(self, status_id):
+        """
+        Checks whether a status exists with a SELECT 1 on the status_id index
+        """
+        return StatusModel.select().where(StatusModel.status_id == status_id).exists()
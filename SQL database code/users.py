@@ -6,12 +6,25 @@ revised to work with database
 # pylint: disable=R0903
 
 from loguru import logger
-from peewee import IntegrityError, DoesNotExist
-from socialnetwork_model import UserModel
+from log_config import configure_logging
+from peewee import IntegrityError, DoesNotExist, chunked
+from socialnetwork_model import (
+    USER_FIELDS,
+    LOOKUP_BATCH_SIZE,
+    USER_ROW,
+    UserModel,
+    pooled,
+    row_class,
+    select_row,
+    status_owner,
+)
+
+# Items per transaction in the bulk methods; 4 fields x 200 rows stays
+# under SQLite's oldest bound-variable limit of 999
+BATCH_SIZE = 200
 
 # set-up logging for users.py
-logger.remove()
-logger.add("log_file_{time:YYYY_MMM_DD}.log")
+configure_logging()
 # logger.add(sys.stderr, level="ERROR")
 # logger.info("users.py is imported")
 # logger.error("Problem here users.py")
@@ -23,67 +36,221 @@ class UserCollection:
     Contains a collection of Users objects
     """
 
-    def __init__(self, database):
+    def __init__(self, database, cache=None):
         self.database = database
+        self.cache = cache
         logger.debug("user database created and linked")
 
+    def _invalidate(self, user_ids):
+        """
+        Drops users, and the statuses cascaded with them, from the cache
+        """
+        if self.cache is not None:
+            self.cache.invalidate_where(
+                lambda key, value: (key[0] == "user" and key[1] in user_ids)
+                or (key[0] == "status" and status_owner(value) in user_ids)
+            )
+
+    @pooled
     def add_user(self, user_id, email, user_name, user_last_name):
         """
         Adds a new user to the collection
         """
         try:
-            with self.database.transaction():
-                result = UserModel.create(
-                    user_id=user_id,
-                    user_email=email,
-                    user_name=user_name,
-                    user_last_name=user_last_name,
-                )
-                result.save()
-                # logger.info("User ID %s successfully added", user_id)
-                return True
+            UserModel.insert(
+                user_id=user_id,
+                user_email=email,
+                user_name=user_name,
+                user_last_name=user_last_name,
+            ).execute()
+            # logger.info("User ID {} successfully added", user_id)
+            if self.cache is not None:
+                self.cache.invalidate(("user", user_id))
+            return True
         except IntegrityError:
-            logger.debug("User ID %s already exists", user_id)
+            logger.debug("User ID {} already exists", user_id)
             return False
 
+    @pooled
     def modify_user(self, user_id, email, user_name, user_last_name):
         """
-        Modifies an existing user
+        Modifies an existing user with a single UPDATE
         """
-        with self.database.transaction():
-            result = self.search_user(user_id)
-            if result:
-                result.user_email = email
-                result.user_name = user_name
-                result.user_last_name = user_last_name
-                result.save()
-                logger.debug("User ID %s successfully modified", user_id)
-                return True
-            logger.debug("User ID %s does not exist", user_id)
-            return False
+        query = UserModel.update(
+            user_email=email,
+            user_name=user_name,
+            user_last_name=user_last_name,
+        ).where(UserModel.user_id == user_id)
+        if query.execute():
+            if self.cache is not None:
+                self.cache.invalidate(("user", user_id))
+            logger.debug("User ID {} successfully modified", user_id)
+            return True
+        logger.debug("User ID {} does not exist", user_id)
+        return False
 
+    @pooled
     def delete_user(self, user_id):
         """
-        Deletes an existing user
+        Deletes an existing user with a single DELETE
+
+        Its statuses are removed by the ON DELETE CASCADE foreign key.
+        """
+        if UserModel.delete().where(UserModel.user_id == user_id).execute():
+            self._invalidate({user_id})
+            logger.debug("User ID {} successfully deleted", user_id)
+            return True
+        logger.debug("User ID {} cannot be deleted as it does not exist", user_id)
+        return False
+
+    @pooled
+    def add_users(self, users):
+        """
+        Adds many users, one transaction per chunk
+
+        users is an iterable of (user_id, email, user_name, user_last_name)
+        tuples. Returns a list of booleans in input order; an item is False
+        when its user ID already exists or repeats an earlier item.
+        """
+        results = []
+        for chunk in chunked(users, BATCH_SIZE):
+            with self.database.transaction():
+                query = UserModel.select(UserModel.user_id).where(
+                    UserModel.user_id.in_([row[0] for row in chunk])
+                )
+                seen = {user_id for (user_id,) in query.tuples()}
+                rows = []
+                for row in chunk:
+                    results.append(row[0] not in seen)
+                    if row[0] not in seen:
+                        seen.add(row[0])
+                        rows.append(tuple(row))
+                if rows:
+                    UserModel.insert_many(rows, fields=USER_FIELDS).execute()
+            if self.cache is not None:
+                for row in rows:
+                    self.cache.invalidate(("user", row[0]))
+        logger.debug("Bulk added {} of {} users", sum(results), len(results))
+        return results
+
+    @pooled
+    def modify_users(self, users):
+        """
+        Modifies many users, one transaction per chunk
+
+        users is an iterable of (user_id, email, user_name, user_last_name)
+        tuples. Returns a list of booleans in input order; an item is False
+        when its user ID does not exist.
+        """
+        results = []
+        for chunk in chunked(users, BATCH_SIZE):
+            with self.database.transaction():
+                for user_id, email, user_name, user_last_name in chunk:
+                    query = UserModel.update(
+                        user_email=email,
+                        user_name=user_name,
+                        user_last_name=user_last_name,
+                    ).where(UserModel.user_id == user_id)
+                    results.append(query.execute() > 0)
+            if self.cache is not None:
+                for row in chunk:
+                    self.cache.invalidate(("user", row[0]))
+        logger.debug("Bulk modified {} of {} users", sum(results), len(results))
+        return results
+
+    @pooled
+    def delete_users(self, user_ids):
+        """
+        Deletes many users, and their statuses, one transaction per chunk
+
+        Returns a list of booleans in input order; an item is False when
+        the user ID does not exist or was already deleted earlier in the call.
+        """
+        results = []
+        for chunk in chunked(user_ids, BATCH_SIZE):
+            with self.database.transaction():
+                query = UserModel.select(UserModel.user_id).where(
+                    UserModel.user_id.in_(chunk)
+                )
+                found = {user_id for (user_id,) in query.tuples()}
+                if found:
+                    UserModel.delete().where(UserModel.user_id.in_(found)).execute()
+            for user_id in chunk:
+                results.append(user_id in found)
+                found.discard(user_id)
+            self._invalidate(set(chunk))
+        logger.debug("Bulk deleted {} of {} users", sum(results), len(results))
+        return results
+
+    def search_users(self, user_ids):
+        """
+        Searches for many users in one transaction
+
+        IDs not served by the cache are read with one IN query per
+        LOOKUP_BATCH_SIZE of them, so any number of IDs costs a fixed
+        number of queries within SQLite's bound-variable limit. Returns a
+        dict mapping each user ID that was found to its UserModel; IDs that
+        do not exist are left out.
+        """
+        if self.cache is None:
+            return self._search_users(list(dict.fromkeys(user_ids)))
+        return self.cache.get_or_load_many("user", user_ids, self._search_users)
+
+    @pooled
+    def _search_users(self, user_ids):
         """
+        Reads a list of distinct users from the database
+        """
+        found = {}
         with self.database.transaction():
-            result = self.search_user(user_id)
-            if result:
-                result.delete_instance()
-                logger.debug("User ID %s successfully deleted", user_id)
-                return True
-            logger.debug("User ID %s cannot be deleted as it does not exist", user_id)
-            return False
+            # Sliced rather than chunked(), which pads every chunk to size
+            for start in range(0, len(user_ids), LOOKUP_BATCH_SIZE):
+                chunk = user_ids[start : start + LOOKUP_BATCH_SIZE]
+                for user in UserModel.select().where(UserModel.user_id.in_(chunk)):
+                    found[user.user_id] = user
+        return found
 
     def search_user(self, user_id):
         """
         Searches for user data
+
+        Served from the cache when one was given to the collection.
+        """
+        if self.cache is None:
+            return self._search_user(user_id)
+        return self.cache.get_or_load(("user", user_id), self._search_user, user_id)
+
+    @pooled
+    def _search_user(self, user_id):
+        """
+        Reads user data from the database
         """
         try:
             with self.database.transaction():
                 result = UserModel.get(UserModel.user_id == user_id)
-                logger.debug("User ID %s found", user_id)
+                logger.debug("User ID {} found", user_id)
                 return result
         except DoesNotExist:
-            logger.debug("User ID %s cannot be found", user_id)
+            logger.debug("User ID {} cannot be found", user_id)
             return False
+
+    @pooled
+    def search_user_row(self, user_id, fields=USER_ROW):
+        """
+        Reads only the named UserModel fields of a user, as a namedtuple
+
+        One SELECT of those columns, with no model instance, transaction or
+        cache; returns False if user_id does not exist.
+        """
+        fields = tuple(fields)
+        row = select_row(UserModel, fields).where(UserModel.user_id == user_id).first()
+        if row is None:
+            return False
+        return row_class(fields)(*row)
+
+    @pooled
+    def exists(self, user_id):
+        """
+        Checks whether a user exists with a SELECT 1 on the user_id index
+        """
+        return UserModel.select().where(UserModel.user_id == user_id).exists()
@@ -0,0 +1,206 @@
+"""
+Validation and quarantine of CSV rows for the social network loaders
+
+Rows that fail a check are written, with their reasons, to a reject CSV
+and left out of the load, so a bad row neither aborts a large import nor
+disappears without a trace.
+"""
+
+import csv
+import re
+import threading
+from contextlib import nullcontext
+from itertools import islice
+from operator import itemgetter
+
+from loguru import logger
+
+import ingest
+
+EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# Longest value accepted per CSV column, taken from the CharField
+# max_length of the SQL schema (255 is peewee's default)
+MAX_LENGTHS = {
+    "USER_ID": 30,
+    "EMAIL": 255,
+    "NAME": 30,
+    "LASTNAME": 100,
+    "STATUS_ID": 30,
+    "STATUS_TEXT": 250,
+}
+
+# Rows sampled by detect_layout
+SAMPLE_ROWS = 100
+
+
+def detect_layout(filename, columns, email_column="EMAIL"):
+    """
+    Returns the row positions that put tuples read by header into the order
+    of columns, or None when the header can be trusted
+
+    accounts.csv is labelled USER_ID,EMAIL,NAME,LASTNAME but stores the
+    user ID, first name, last name and email. When the email_column of the
+    sampled rows holds no addresses but another column does, the email is
+    taken from that column and the remaining columns fill the other
+    headers in order.
+    """
+    headers = list(columns)
+    sample = list(
+        islice(ingest.map_rows(filename, columns, skip_incomplete=False), SAMPLE_ROWS)
+    )
+    if not sample:
+        return None
+    hits = [
+        sum(1 for row in sample if row[i] and EMAIL.match(row[i]))
+        for i in range(len(headers))
+    ]
+    found = max(range(len(headers)), key=hits.__getitem__)
+    expected = headers.index(email_column)
+    if found == expected or hits[found] < len(sample) / 2:
+        return None
+    others = [i for i in range(len(headers)) if i != found]
+    others.insert(expected, found)
+    logger.warning(
+        "{} stores {} in the {} column; reading it from there",
+        filename,
+        email_column,
+        headers[found],
+    )
+    return others
+
+
+class Quarantine:
+    """
+    Screens batches of row tuples and writes failing rows to a reject CSV
+
+    columns is the CSV header to field mapping the rows were read with; the
+    first column is the row's ID and a USER_ID column that is not first
+    refers to a user. id_exists(ids) and user_exists(ids) return the subset
+    of ids already stored, so duplicates and unknown users are caught with
+    one lookup per batch. Use as a context manager; counts go to stats.
+    With append=True rows are added to an existing reject file, as when a
+    checkpointed load resumes.
+    """
+
+    def __init__(
+        self, filename, columns, stats, id_exists=None, user_exists=None, append=False
+    ):
+        self.filename = filename
+        self.headers = list(columns)
+        self.stats = stats
+        self.id_exists = id_exists
+        self.user_exists = user_exists
+        self.append = append
+        self.user_column = (
+            self.headers.index("USER_ID") if "USER_ID" in self.headers[1:] else None
+        )
+        self._lock = threading.Lock()
+        self._file = None
+        self._writer = None
+
+    def __enter__(self):
+        self._file = open(  # pylint: disable=consider-using-with
+            self.filename, "a" if self.append else "w", encoding="utf-8", newline=""
+        )
+        self._writer = csv.writer(self._file)
+        if not self._file.tell():
+            self._writer.writerow(self.headers + ["REASONS"])
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+        logger.info("Load of {}: {}", self.filename, self.stats)
+
+    def check(self, row):
+        """
+        Returns the reasons a single row cannot be loaded
+        """
+        reasons = []
+        for header, value in zip(self.headers, row):
+            if not value:
+                reasons.append(f"missing {header}")
+            elif len(value) > MAX_LENGTHS.get(header, len(value)):
+                reasons.append(f"{header} longer than {MAX_LENGTHS[header]}")
+            elif header == "EMAIL" and not EMAIL.match(value):
+                reasons.append("invalid EMAIL")
+        return reasons
+
+    def screen(self, rows):
+        """
+        Returns the rows of a batch that pass every check
+
+        The others are written to the reject file. Safe to call from
+        several writer threads.
+        """
+        ids = {row[0] for row in rows if row[0]}
+        taken = self.id_exists(ids) if self.id_exists and ids else set()
+        known = None
+        if self.user_exists and self.user_column is not None:
+            users = {row[self.user_column] for row in rows if row[self.user_column]}
+            known = self.user_exists(users) if users else set()
+        good = []
+        rejected = []
+        for row in rows:
+            reasons = self.check(row)
+            if row[0] in taken:
+                reasons.append(f"duplicate {self.headers[0]}")
+            if (
+                known is not None
+                and row[self.user_column]
+                and row[self.user_column] not in known
+            ):
+                reasons.append("unknown USER_ID")
+            if reasons:
+                rejected.append((row, reasons))
+            else:
+                taken.add(row[0])
+                good.append(row)
+        if rejected:
+            self._reject(rejected)
+        return good
+
+    def _reject(self, rejected):
+        """
+        Writes rejected rows with their reasons and counts them
+        """
+        with self._lock:
+            for row, reasons in rejected:
+                self._writer.writerow(
+                    ["" if value is None else value for value in row]
+                    + ["; ".join(reasons)]
+                )
+                for reason in reasons:
+                    self.stats.reasons[reason] = self.stats.reasons.get(reason, 0) + 1
+            self.stats.rejected += len(rejected)
+
+
+def quarantine(
+    filename, columns, stats, id_exists=None, user_exists=None, append=False
+):
+    """
+    Returns a Quarantine writing to filename, or a context yielding None
+    when no reject file was asked for
+    """
+    if filename is None:
+        return nullcontext()
+    return Quarantine(filename, columns, stats, id_exists, user_exists, append)
+
+
+def screening(write_batch, screen=None, layout=None):
+    """
+    Wraps an ingest write_batch so each batch is first reordered by layout
+    (see detect_layout) and then screened by a Quarantine
+    """
+    reorder = itemgetter(*layout) if layout else None
+
+    def write(batch):
+        if reorder is not None:
+            batch = [reorder(row) for row in batch]
+        if screen is not None:
+            batch = screen.screen(batch)
+            if not batch:
+                return True
+        return write_batch(batch)
+
+    return write